@@ -0,0 +1,150 @@
+"""Benchmark suite: generates synthetic save files and times the main operations on them,
+headlessly using SDL's dummy video driver. Results are written as JSON, to compare runs and track regressions.
+
+Usage: python benchmarks/bench.py [--shapes chain tree ...] [--sizes 100 1000 ...] [--skip export] [--output results.json]"""
+
+import os
+import sys
+from argparse import ArgumentParser
+from json import dump
+from platform import platform, python_version
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep, strftime
+
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+import progression_graph as pg
+from generate import SHAPES, generate
+
+ZOOMS = (0.1, 0.3, 1, 3)
+
+def timed(function, repeat):
+    """Calls function repeat times, returns the list of durations in seconds"""
+    times = []
+    for _ in range(repeat):
+        t = perf_counter()
+        function()
+        times.append(perf_counter()-t)
+    return times
+
+def frames(n):
+    """Runs n frames of the editor, without any input"""
+    for _ in range(n):
+        pg.graph.update([])
+        pygame.display.flip()
+        pg.graph.profiler.end_frame()
+
+def center_camera():
+    """Puts the camera at the average node position"""
+    nodes = pg.Manager.nodes.values()
+    pg.graph.scroll_x = sum(node.x for node in nodes)/len(nodes)
+    pg.graph.scroll_y = sum(node.y for node in nodes)/len(nodes)
+
+def bench_file(shape, size, tmp, args):
+    """Runs all the benchmarks on a generated file, returns a list of results"""
+
+    file = os.path.join(tmp, '%s_%d.graph' %(shape, size))
+    n_nodes, n_links, n_images = generate(shape, size, file, args.seed)
+    results = []
+
+    def add(name, times, **extra):
+        result = {'shape': shape, 'nodes': n_nodes, 'links': n_links, 'images': n_images,
+                  'benchmark': name, 'times': times, 'min': min(times), 'median': median(times)}
+        result.update(extra)
+        results.append(result)
+        print('%-8s %7d nodes  %-14s %10.2f ms' %(shape, n_nodes, name, result['median']*1000), file=sys.stderr)
+
+    graph = pg.graph
+    add('open', timed(lambda: graph.open(file), args.repeat))
+
+    # frames at different zoom levels, measured one by one
+    if 'frames' not in args.skip:
+        center_camera()
+        for zoom in ZOOMS:
+            graph.zoom = zoom
+            frames(1) # refresh the cached node surfaces for this zoom
+            add('frame_zoom_%g' %zoom, timed(lambda: frames(1), args.frames), zoom=zoom)
+        graph.zoom = 1
+
+    # full save, then appending a one-node change to the journal
+    graph.save_file = os.path.join(tmp, 'saved.graph')
+    def save_full():
+        pg.Journal.reset(None)
+        graph.save()
+    add('save_full', timed(save_full, args.repeat))
+
+    node = next(iter(pg.Manager.nodes.values()))
+    def save_journal():
+        node.x += 0.1
+        pg.Journal.changed_node(node)
+        graph.save()
+    add('save_journal', timed(save_journal, args.repeat))
+
+    png = os.path.join(tmp, 'export.png')
+    if 'export' not in args.skip:
+        try:
+            add('export', timed(lambda: graph.export_to(png, False), args.repeat))
+        except (MemoryError, pygame.error) as e:
+            print('export failed:', e, file=sys.stderr)
+        add('export_svg', timed(lambda: graph.export_svg_to(os.path.join(tmp, 'export.svg'), False), args.repeat))
+
+    if 'tiles' not in args.skip:
+        def export_tiles():
+            exporter = pg.TileExporter(os.path.join(tmp, 'tiles.dzi'), False)
+            exporter.start()
+            while not exporter.done(): sleep(0.01)
+            exporter.stop()
+            if exporter.error is not None: raise exporter.error
+        add('export_tiles', timed(export_tiles, args.repeat))
+
+    # bulk insertion, in a new graph
+    positions = [(node.x, node.y, node.rank, node.state) for node in pg.Manager.nodes.values()]
+    def insert():
+        graph.newfile()
+        for x, y, rank, state in positions:
+            pg.Manager.new_node(x, y, rank, state)
+    add('new_node_bulk', timed(insert, args.repeat))
+
+    graph.newfile()
+    return results
+
+def main():
+    parser = ArgumentParser(description='Progression graph benchmarks')
+    parser.add_argument('--shapes', nargs='+', choices=SHAPES, default=SHAPES)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000])
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each operation')
+    parser.add_argument('--frames', type=int, default=30, help='measured frames for each zoom level')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip', nargs='+', choices=('frames', 'export', 'tiles'), default=[], help='slow benchmarks to skip')
+    parser.add_argument('--output', help='JSON results file, printed to stdout if not specified')
+    args = parser.parse_args()
+
+    pg.init()
+    pg.FPS = 0 # don't limit the frame rate of the loading screen
+
+    results = []
+    with TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            for shape in args.shapes:
+                results += bench_file(shape, size, tmp, args)
+
+    report = {'date': strftime('%Y-%m-%d %H:%M:%S'),
+              'python': python_version(),
+              'pygame': pygame.version.ver,
+              'platform': platform(),
+              'args': vars(args),
+              'results': results}
+
+    if args.output is None:
+        dump(report, sys.stdout, indent=1)
+    else:
+        with open(args.output, 'w') as f:
+            dump(report, f, indent=1)
+
+    pygame.quit()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Synthetic save files generator, used by the benchmarks.
+Can also be used on its own: python generate.py shape nodes file.graph"""
+
+from zipfile import ZipFile
+from random import Random
+from math import sqrt
+from sys import argv
+
+SHAPES = ('chain', 'tree', 'dag', 'images', 'text')
+
+WORDS = ('wooden', 'stone', 'iron', 'gold', 'diamond', 'pickaxe', 'sword', 'furnace', 'crafting', 'table',
+         'the', 'of', 'ingot', 'block', 'ore', 'enchanted', 'book', 'potion', 'nether', 'portal')
+
+def chain(n, rng):
+    """Nodes following a winding path, each linked to the previous one"""
+    nodes = []
+    x = y = 0
+    for i in range(n):
+        nodes.append((x, y))
+        x += 1.5
+        y += rng.uniform(-0.5, 0.5)
+    links = [(i-1, i) for i in range(1, n)]
+    return nodes, links
+
+def tree(n, rng, children=3):
+    """Nodes in a tree, each node having up to `children` children on the next row"""
+    nodes = []
+    links = []
+    depth = 0
+    row = [0] # node IDs in the current row
+    nodes.append((0, 0))
+    while len(nodes) < n:
+        depth += 1
+        new_row = []
+        for parent in row:
+            for _ in range(children):
+                if len(nodes) == n: break
+                new_row.append(len(nodes))
+                links.append((parent, len(nodes)))
+                nodes.append((0, depth*2))
+            if len(nodes) == n: break
+        row = new_row
+
+        # spread the row horizontally
+        for i, id in enumerate(row):
+            nodes[id] = ((i - len(row)/2)*1.5, depth*2)
+    return nodes, links
+
+def dag(n, rng, parents=5):
+    """Progression DAG: square-ish layers, each node linked to up to `parents` nodes of the previous layer"""
+    width = max(int(sqrt(n)), 1)
+    nodes = []
+    links = []
+    for i in range(n):
+        layer, j = divmod(i, width)
+        nodes.append((j*1.5, layer*2 + rng.uniform(-0.3, 0.3)))
+        if layer:
+            previous = range((layer-1)*width, layer*width)
+            for parent in rng.sample(previous, min(parents, width)):
+                links.append((parent, i))
+    return nodes, links
+
+def image_blob(rng, size=32):
+    """Image file content, in the format used in save files: width.height.RGBA data"""
+    r, g, b = rng.randrange(256), rng.randrange(256), rng.randrange(256)
+    pixels = bytearray()
+    for y in range(size):
+        for x in range(size):
+            shade = (x^y) & 31
+            pixels += bytes((min(r+shade, 255), min(g+shade, 255), min(b+shade, 255), 255))
+    return b'%d.%d.%s' %(size, size, bytes(pixels))
+
+def generate(shape, n, file, seed=0, n_images=64):
+    """Writes a save file containing n nodes in the given shape.
+    The images and text shapes are DAGs with an image, respectively text, on every node.
+    Returns (number of nodes, number of links, number of images)"""
+
+    rng = Random(seed)
+    if shape == 'chain': nodes, links = chain(n, rng)
+    elif shape == 'tree': nodes, links = tree(n, rng)
+    elif shape in ('dag', 'images', 'text'): nodes, links = dag(n, rng)
+    else: raise ValueError('Unknown shape: '+shape)
+
+    content = ['# GENERAL INFO', '_S 0 0', '_Z 1', '', '# NODES']
+    for id, (x, y) in enumerate(nodes):
+        content.append('P %f %f %d %d %d' %(x, y, rng.choice((0, 0, 0, 1, 1, 2, 3, 4)), rng.randrange(3), id))
+
+    content += ('', '# LINKS')
+    for id, (n1, n2) in enumerate(links):
+        content.append('L %d %d %d' %(n1, n2, id))
+
+    images = {}
+    if shape == 'images':
+        images = {'image_%d.png' %i: image_blob(rng) for i in range(min(n_images, n))}
+        content += ('', '# IMAGES')
+        for id, name in enumerate(images):
+            content.append('I %s %d' %(name, id))
+        content += ('', '# LINK IMAGES')
+        for id in range(len(nodes)):
+            content.append('Ai %d %d' %(id, id % len(images)))
+
+    if shape == 'text':
+        content += ('', '# TEXT')
+        for id in range(len(nodes)):
+            text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+            content.append('At %d %s' %(id, text.replace(' ', '\0')))
+
+    with ZipFile(file, 'w') as z:
+        z.writestr('save.txt', '\n'.join(content)+'\n')
+        for name, blob in images.items():
+            z.writestr(name, blob)
+
+    return len(nodes), len(links), len(images)
+
+if __name__ == '__main__':
+    if len(argv) != 4 or argv[1] not in SHAPES:
+        print('Usage: python generate.py [%s] nodes file.graph' %'|'.join(SHAPES))
+    else:
+        print('%d nodes, %d links, %d images' %generate(argv[1], int(argv[2]), argv[3]))
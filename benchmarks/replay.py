@@ -0,0 +1,89 @@
+"""Replays an input recording (made with F6 while the F3 overlay is displayed) headlessly, as fast as possible,
+and writes the time taken by each frame as JSON. Recordings of slow editing sessions can then be used as benchmarks.
+
+File dialogs are not recorded, so recordings should not open, save as, import or export files.
+
+Usage: python benchmarks/replay.py recording.jsonl [--file save.graph] [--repeat 3] [--output results.json]"""
+
+import os
+import sys
+from argparse import ArgumentParser
+from json import dump
+from statistics import median
+from time import perf_counter, strftime
+
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+import progression_graph as pg
+
+def replay(recording, file):
+    """Opens the save file the recording started from, replays it.
+    Returns the list of (frame time, {subsystem: time}, {counter: value}) of every frame, in ms"""
+
+    # same state as when the recording started
+    header, recorded = pg.Input.load_recording(recording)
+    pg.Graph.W, pg.Graph.H = header['size']
+    pg.screen = pygame.display.set_mode(header['size'])
+    pg.graph.resize()
+
+    file = file or header['file']
+    if file is None: pg.graph.newfile()
+    else: pg.graph.open(file)
+    pg.graph.scroll_x, pg.graph.scroll_y = header['scroll']
+    pg.graph.zoom = header['zoom']
+
+    pg.Input.start_replay(recorded)
+    frames = []
+    while pg.Input.replay is not None:
+        t = perf_counter()
+        events = pg.Input.poll()
+        for event in events:
+            if event.type == pygame.VIDEORESIZE:
+                pg.graph.resize()
+
+        pg.graph.update(events)
+        pygame.display.flip()
+        pg.graph.profiler.end_frame()
+
+        _, timings, counts = pg.graph.profiler.frames[-1]
+        frames.append(((perf_counter()-t)*1000, timings, counts))
+
+    # the last poll() returned the live events instead of a recorded frame
+    return frames[:-1]
+
+def main():
+    parser = ArgumentParser(description='Replays an input recording and measures frame times')
+    parser.add_argument('recording')
+    parser.add_argument('--file', help='save file to start from, instead of the one in the recording')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', help='JSON results file, printed to stdout if not specified')
+    args = parser.parse_args()
+
+    pg.init()
+    pg.FPS = 0 # don't limit the frame rate of popups
+
+    runs = []
+    for i in range(args.repeat):
+        frames = replay(args.recording, args.file)
+        if not len(frames): sys.exit('empty recording')
+        times = [frame for frame, _, _ in frames]
+        runs.append({'total': sum(times), 'median': median(times), 'max': max(times),
+                     'frames': [{'frame': frame, 'timings': timings, 'counts': counts}
+                                for frame, timings, counts in frames]})
+        print('run %d: %d frames, %.1f ms total, %.2f ms median, %.2f ms max'
+              %(i+1, len(times), sum(times), median(times), max(times)), file=sys.stderr)
+
+    report = {'date': strftime('%Y-%m-%d %H:%M:%S'), 'recording': args.recording,
+              'pygame': pygame.version.ver, 'runs': runs}
+    if args.output is None:
+        dump(report, sys.stdout, indent=1)
+    else:
+        with open(args.output, 'w') as f:
+            dump(report, f, indent=1)
+
+    pygame.quit()
+
+if __name__ == '__main__':
+    main()
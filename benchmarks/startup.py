@@ -0,0 +1,102 @@
+"""Startup benchmark: launches the editor in fresh processes, headlessly using SDL's dummy video driver,
+and measures the time until the first frame is displayed, optionally opening a save file given like on the command line.
+Exits with an error if the median exceeds the budget, so that it can be used to catch startup regressions.
+
+Usage: python benchmarks/startup.py [--file save.graph | --nodes 1000] [--runs 5] [--budget 1000] [--output results.json]"""
+
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser
+from json import dump, loads
+from platform import platform, python_version
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter, strftime
+
+from generate import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in the launched process, prints the time taken by each step in seconds
+CHILD = '''
+import os, sys
+from json import dumps
+from time import perf_counter
+start = perf_counter()
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+sys.path.insert(0, %r)
+
+import pygame
+t_pygame = perf_counter()
+import progression_graph as pg
+t_import = perf_counter()
+pg.init()
+t_init = perf_counter()
+for i, file in enumerate(sys.argv[1:]):
+    pg.graph.open(file, i > 0)
+t_open = perf_counter()
+pg.graph.update([])
+pygame.display.flip()
+t_frame = perf_counter()
+
+print(dumps({'pygame': t_pygame-start, 'import': t_import-t_pygame, 'init': t_init-t_import,
+             'open': t_open-t_init, 'frame': t_frame-t_open, 'dialogs_imported': 'tkinter' in sys.modules}))
+''' %ROOT
+
+def launch(files):
+    """Starts the editor in a new process, returns the wall time until its first frame and its steps, in ms"""
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT='1')
+    t = perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD] + files, env=env, capture_output=True, text=True, check=True)
+    total = perf_counter()-t
+    steps = loads(result.stdout.strip().split('\n')[-1])
+    dialogs = steps.pop('dialogs_imported')
+    steps = {name: time*1000 for name, time in steps.items()}
+    # interpreter startup and shutdown, not measured by the child
+    steps['python'] = total*1000 - sum(steps.values())
+    return total*1000, steps, dialogs
+
+def main():
+    parser = ArgumentParser(description='Progression graph startup benchmark')
+    parser.add_argument('--file', help='save file opened on startup')
+    parser.add_argument('--nodes', type=int, default=0, help='generates a dag save file of this size to open, if no file is given')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=1000, help='maximum median time to the first frame, in ms')
+    parser.add_argument('--output', help='JSON results file, printed to stdout if not specified')
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmp:
+        files = []
+        if args.file is not None: files = [args.file]
+        elif args.nodes:
+            files = [os.path.join(tmp, 'startup.graph')]
+            generate('dag', args.nodes, files[0])
+
+        launch(files) # compiles the module and fills the disk cache, not measured
+        runs = []
+        for i in range(args.runs):
+            total, steps, dialogs = launch(files)
+            runs.append({'total': total, 'steps': steps, 'dialogs_imported': dialogs})
+            print('run %d: %7.1f ms  (%s)' %(i+1, total, ', '.join('%s %.1f' %item for item in steps.items())), file=sys.stderr)
+
+    total = median(run['total'] for run in runs)
+    report = {'date': strftime('%Y-%m-%d %H:%M:%S'),
+              'python': python_version(),
+              'platform': platform(),
+              'args': vars(args),
+              'median': total,
+              'steps': {name: median(run['steps'][name] for run in runs) for name in runs[0]['steps']},
+              'runs': runs}
+
+    if args.output is None:
+        dump(report, sys.stdout, indent=1)
+    else:
+        with open(args.output, 'w') as f:
+            dump(report, f, indent=1)
+
+    print('median: %.1f ms, budget: %.0f ms' %(total, args.budget), file=sys.stderr)
+    if total > args.budget: sys.exit('startup is over budget')
+
+if __name__ == '__main__':
+    main()
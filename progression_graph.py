@@ -1,18 +1,36 @@
 import pygame
 from zipfile import ZipFile
-from math import sqrt, floor, log
-from os.path import exists, splitext, basename
+from math import floor, ceil, log, log2
+from time import perf_counter, strftime
+from collections import deque
+from itertools import islice
+from json import dumps, loads
+from io import BytesIO
+from base64 import b64encode
+import os
+from os.path import exists, splitext, basename, join
+from tempfile import mkstemp
+from hashlib import blake2b
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
 from pygame.locals import *
 
-# lower fps if window inactive, but needs win32 utils to do that
-from sys import platform
-if 'win' in platform:
-    import win32gui
-else:
-    class win32gui:
-        def GetForegroundWindow(*args): return True
+from sys import platform, argv
+from threading import Thread
 
-from tkinter.filedialog import askopenfilename, asksaveasfilename
+# the dialogs toolkit is only imported when a dialog is first opened, as it slows down the startup
+
+def askopenfilename(**options):
+    import tkinter.filedialog
+    return tkinter.filedialog.askopenfilename(**options)
+
+def asksaveasfilename(**options):
+    import tkinter.filedialog
+    return tkinter.filedialog.asksaveasfilename(**options)
+
+def askdirectory(**options):
+    import tkinter.filedialog
+    return tkinter.filedialog.askdirectory(**options)
 
 def get_popup_bg(message):
     """Creates the base for a popup. Returns the created background from a message string."""
@@ -61,7 +79,7 @@ def ask_input_box(message, cast, check=lambda s: len(s), max_width=400, autofill
     run = True
     while run:
         enter = False # for when to try to get out of the loop
-        events = pygame.event.get()
+        events = Input.poll()
         for event in events:
             if event.type == QUIT:
                 pygame.event.post(pygame.event.Event(QUIT))
@@ -133,7 +151,7 @@ def ask_button(message, buttons):
     run = True
     res = None # returned result
     while run:
-        events = pygame.event.get()
+        events = Input.poll()
         for event in events:
             if event.type == QUIT:
                 run = False
@@ -158,17 +176,68 @@ def ask_button(message, buttons):
     screen.blit(old_screen, (0, 0))
     return res
 
-def import_image():
-    files = askopenfilename(title='Import image(s)', filetypes=(('Image files', ('png', 'jpg', 'bmp', 'gif')),), multiple=True)
-    pygame.event.get()
+IMAGE_TYPES = ('png', 'jpg', 'bmp', 'gif')
+
+def import_image(directory=False):
+    """Asks for image files, or for a directory whose images are all imported, and adds them to the images bank.
+    The files are decoded and downscaled by a pool of threads while a progress bar is displayed,
+    the images being added in the order of the files on the main thread."""
+
+    if directory:
+        folder = askdirectory(title='Import images directory')
+        pygame.event.get()
+        if not folder: return
+        files = [join(folder, name) for name in sorted(os.listdir(folder))
+                 if splitext(name)[1][1:].lower() in IMAGE_TYPES]
+    else:
+        files = askopenfilename(title='Import image(s)', filetypes=(('Image files', IMAGE_TYPES),), multiple=True)
+        pygame.event.get()
+        if type(files) != tuple: return # double protection in case API changes
+    if not len(files): return
+
+    executor = ThreadPoolExecutor()
+    futures = [executor.submit(Image.load_file, file) for file in files]
+    added = 0 # files whose image was added, or failed
+    failed = []
+
+    old_screen, background = get_popup_bg('Importing %d image(s)...' %len(files))
+    cancel = Button('Cancel', Graph.W/2, Graph.H*2/3)
+    bar = Rect(Graph.W*0.25, Graph.H/2 - 8, Graph.W*0.5, 16)
+
+    run = True
+    while run and added < len(files):
+        events = Input.poll()
+        for event in events:
+            if event.type == QUIT:
+                run = False
+                pygame.event.post(pygame.event.Event(QUIT))
+            elif event.type == KEYDOWN and event.key == K_ESCAPE:
+                run = False
+            elif event.type == VIDEORESIZE:
+                graph.resize()
 
-    if type(files) == tuple and len(files): # double protection in case API changes
-        for file in files:
+        while added < len(files) and futures[added].done():
             try:
-                # None to tell the constructor that the image comes from the disk
-                Manager.new_image(file, None)
-            except:
-                print('Error loading image')
+                Manager.new_image(files[added], futures[added].result())
+            except Exception:
+                failed.append(basename(files[added]))
+            added += 1
+
+        screen.blit(background, (0, 0))
+
+        # progress bar
+        pygame.draw.rect(screen, Palette.neutral, bar)
+        pygame.draw.rect(screen, Palette.text, Rect(bar.x, bar.y, bar.w*added/len(files), bar.h))
+
+        if cancel.update(events): run = False
+
+        pygame.display.flip()
+        clock.tick(FPS)
+
+    # the images added before cancelling are kept
+    executor.shutdown(wait=False, cancel_futures=True)
+    screen.blit(old_screen, (0, 0))
+    if len(failed): Error.image_import(failed)
 
 def ask_filename(new=False):
     """Triggers a filedialog to select a save file, and returns the file.
@@ -182,7 +251,7 @@ def ask_filename(new=False):
         # make sure the file has the right extension
         if file and not file.endswith('.graph'): file += '.graph'
 
-    else: file = askopenfilename(title='Open save file', filetypes=filetype)
+    else: file = askopenfilename(title='Open save file', filetypes=filetype + Formats.filetypes())
 
     pygame.event.get()
     return file
@@ -190,18 +259,10 @@ def ask_filename(new=False):
 def image_selector():
     """Graphical image selector, displays all loaded images into a grid for the user to select"""
 
-    # get and resize all loaded images
     images = list(Manager.images.values())
-    ids = list(Manager.images.keys())
-    for i, image in enumerate(images):
-        surf = image.surf
-        w, h = surf.get_size()
-        if w > h: w, h = 50, 50*h/w
-        else: w, h = 50*w/h, 50
-        images[i] = pygame.transform.scale(surf, (w, h))
 
     w = (Graph.W-50) // 90 # images in one row
-    iheight = len(images)//w*90 + 50 # total images table height
+    iheight = ceil(len(images)/w)*90 + 50 # total images table height
     vheight = Graph.H-46 # visible height
     scroll = 0
     do_scroll = iheight > vheight
@@ -212,7 +273,7 @@ def image_selector():
     run = True
     selection = None
     while run:
-        events = pygame.event.get()
+        events = Input.poll()
         for event in events:
             if event.type == QUIT:
                 run = False
@@ -236,11 +297,13 @@ def image_selector():
             h = vheight*vheight/iheight - 20
             pygame.draw.rect(screen, Palette.text, Rect(Graph.W-15, 10+y, 5, h))
 
-        # get mouse data and display images
-        mx, my = pygame.mouse.get_pos()
-        click = pygame.mouse.get_pressed()[0]
+        # get mouse data and display the images of the visible rows,
+        # their thumbnails are made the first time they are displayed
+        mx, my = Input.pos
+        click = Input.pressed[0]
         selection = None
-        for i, image in enumerate(images):
+        first, last = max((scroll-100)//90, 0), (scroll+vheight-50)//90 + 1
+        for i in range(first*w, min(last*w, len(images))):
             x, y = 50 + 90*(i%w), 50 + 90*(i//w) - scroll
             if -50 < y < vheight:
                 if x-10 <= mx < x+60 and y-10 <= my < y+60:
@@ -249,7 +312,109 @@ def image_selector():
                     if click:
                         selection = i # image clicked
                         run = False
-                screen.blit(image, (x, y))
+                screen.blit(images[i].get_thumbnail(), (x, y))
+
+        # display bottom border and Cancel button
+        pygame.draw.rect(screen, border_col, Rect(0, vheight, Graph.W, 46))
+        if cancel.update(events):
+            run = False
+            selection = None
+
+        pygame.display.flip()
+        clock.tick(FPS)
+
+    if selection is None: return
+    return images[selection]
+
+def read_preview(file):
+    """Returns (preview surface, stats) of a save file, written by Graph.write_preview and Graph.save_journal,
+    only reading these entries of the zip file. They are None if not found, in files saved by older versions."""
+    try:
+        with ZipFile(file) as z:
+            names = set(z.namelist())
+            # the stats of the last journal entry, or of the last full save
+            journal = sorted(name for name in names if name.startswith('stats/'))
+            name = journal[-1] if len(journal) else 'preview.json'
+            if name not in names: return None, None
+
+            stats = loads(z.read(name))
+            surf = pygame.image.load(BytesIO(z.read('preview.png')), 'preview.png').convert() if 'preview.png' in names else None
+            return surf, stats
+    except Exception:
+        return None, None
+
+def browse_files():
+    """Displays the previews of the save files of a directory into a grid, for the user to select one of them.
+    The previews are read when first displayed. Returns the selected file, or None."""
+
+    directory = askdirectory(title='Browse save files', initialdir=None if graph.save_file is None else os.path.dirname(graph.save_file))
+    pygame.event.get()
+    if not directory: return
+    files = sorted(join(directory, file) for file in os.listdir(directory) if file.endswith('.graph'))
+    previews = {} # key: file, value: (preview surface, name surface, stats surface)
+
+    w = max((Graph.W-50) // 230, 1) # files in one row
+    iheight = ceil(len(files)/w)*270 + 50 # total files table height
+    vheight = Graph.H-46 # visible height
+    scroll = 0
+    do_scroll = iheight > vheight
+
+    cancel = Button('Cancel', Graph.W/2, Graph.H-36)
+    border_col = Palette.mult(Palette.background, 1.2)
+
+    run = True
+    selection = None
+    while run:
+        events = Input.poll()
+        for event in events:
+            if event.type == QUIT:
+                run = False
+                selection = None
+                pygame.event.post(pygame.event.Event(QUIT))
+            elif event.type == MOUSEWHEEL and do_scroll:
+                scroll = min(max(scroll - 40*event.y, 0), iheight-vheight)
+            elif event.type == KEYDOWN and event.key == K_ESCAPE:
+                run = False
+            elif event.type == VIDEORESIZE:
+                graph.resize()
+
+        screen.fill(Palette.background)
+        if not len(files):
+            text = font.render('No save files in this directory', True, Palette.text)
+            screen.blit(text, (Graph.W/2 - text.get_width()/2, 50))
+
+        # draw scrollbar if needed
+        if do_scroll:
+            y = scroll * vheight / (iheight-20)
+            h = vheight*vheight/iheight - 20
+            pygame.draw.rect(screen, Palette.text, Rect(Graph.W-15, 10+y, 5, h))
+
+        # display the files of the visible rows
+        mx, my = Input.pos
+        click = Input.pressed[0]
+        first, last = max((scroll-270)//270, 0), (scroll+vheight-50)//270 + 1
+        for i in range(first*w, min(last*w, len(files))):
+            x, y = 50 + 230*(i%w), 50 + 270*(i//w) - scroll
+            if -270 < y < vheight:
+                file = files[i]
+                if file not in previews:
+                    surf, stats = read_preview(file)
+                    name = font.render(splitext(basename(file))[0], True, Palette.text)
+                    if stats is None: info = 'No preview'
+                    else: info = '%d nodes, %d links, %d images' %(stats['nodes'], stats['links'], stats['images'])
+                    previews[file] = surf, name, font2.render(info, True, Palette.text)
+                surf, name, info = previews[file]
+
+                if x-10 <= mx < x+210 and y-10 <= my < y+250:
+                    # file hovered
+                    pygame.draw.rect(screen, Palette.neutral, Rect(x-10, y-10, 220, 260))
+                    if click:
+                        selection = i
+                        run = False
+                pygame.draw.rect(screen, border_col, Rect(x, y, 200, 200))
+                if surf is not None: screen.blit(surf, (x + 100 - surf.get_width()/2, y + 100 - surf.get_height()/2))
+                screen.blit(name, (x, y+205), Rect(0, 0, 200, name.get_height()))
+                screen.blit(info, (x, y+225), Rect(0, 0, 200, info.get_height()))
 
         # display bottom border and Cancel button
         pygame.draw.rect(screen, border_col, Rect(0, vheight, Graph.W, 46))
@@ -261,7 +426,7 @@ def image_selector():
         clock.tick(FPS)
 
     if selection is None: return
-    return Manager.images[ids[selection]]
+    return files[selection]
 
 class Button:
     """Simple button widget to use in popups"""
@@ -295,8 +460,8 @@ class Button:
         """Returns True if the button is clicked, False otherwise.
         The button is also updated and drawn on the screen"""
 
-        mx, my = pygame.mouse.get_pos()
-        click = pygame.mouse.get_pressed()[0]
+        mx, my = Input.pos
+        click = Input.pressed[0]
         hovered = self.x - self.w/2 <= mx <= self.x + self.w/2 and \
                   self.y <= my <= self.y + self.h
 
@@ -316,9 +481,9 @@ class Error:
     """Static class, used to make handling exceptions easier"""
 
     @staticmethod
-    def syntax(y, expression):
+    def syntax(y, expression, file='save.txt'):
         """Used to help handling file parsing errors"""
-        ask_button('Could not parse save file at line %d:\n"%s"\nAborting file loading' %(y+1, expression), [(0, 'OK')])
+        ask_button('Could not parse %s at line %d:\n"%s"\nAborting file loading' %(file, y+1, expression), [(0, 'OK')])
 
     @staticmethod
     def corrupted_file(comment, success):
@@ -326,6 +491,17 @@ class Error:
         load_text = 'The file will still be loaded, check for side-effects.' if success else ''
         ask_button('Detected save file corruption:\n"%s"\n%s' %(comment, load_text), [(0, 'OK')])
 
+    @staticmethod
+    def image_import(files):
+        """Used when some of the imported image files couldn't be loaded"""
+        names = '\n'.join(files[:5]) + ('\n...' if len(files) > 5 else '')
+        ask_button('Could not import %d image(s):\n%s' %(len(files), names), [(0, 'OK')])
+
+    @staticmethod
+    def import_file(error):
+        """Used when an error occurs while importing a file from another format"""
+        ask_button('Error while importing the file:\n"%s"\nAborting file loading' %error, [(0, 'OK')])
+
     @staticmethod
     def zipfile(error):
         """Used when an error occurs while loading the save zip file"""
@@ -345,6 +521,10 @@ class Palette:
     selection_outline = (255, 255, 255, 100)
     selection_fill = (255, 255, 255, 30)
 
+    # progression overlay: outline of the available nodes, filter over the locked ones
+    available = (255, 255, 255)
+    locked = (0, 0, 0, 150)
+
     # contains a nested list: [[todo normal, todo hovered, todo selected], [doing], [completed]]
     link = [None]*3
     # same but darker for the center
@@ -385,19 +565,179 @@ class Palette:
 
 Palette.__init__()
 
+class Input:
+    """Static class, source of the events and mouse state of each frame.
+    They are read from pygame, or from a recording being replayed, so that editing sessions
+    can be replayed deterministically (see benchmarks/replay.py). They can also be recorded into a file.
+
+    Recordings are JSON lines: a header with the save file and camera when the recording started,
+    then one line per frame with the mouse state and the events. The replay starts from the save file
+    as it is on disk, so recordings should be started right after opening or saving a file."""
+
+    pos = (0, 0)
+    pressed = (False, False, False)
+    focused = True
+
+    record_file = None # file object while recording
+    replay = None # iterator over the recorded frames while replaying
+
+    @staticmethod
+    def poll():
+        """Updates the mouse state and returns the events of the new frame"""
+
+        if Input.replay is not None:
+            frame = next(Input.replay, None)
+            if frame is None:
+                Input.replay = None # done, back to the user's input
+            else:
+                Input.pos, Input.pressed, Input.focused = tuple(frame['pos']), tuple(frame['pressed']), frame['focused']
+                events = [pygame.event.Event(type, Input.decode(d)) for type, d in frame['events']]
+
+        if Input.replay is None:
+            events = pygame.event.get()
+            Input.pos = pygame.mouse.get_pos()
+            Input.pressed = pygame.mouse.get_pressed()
+            Input.focused = pygame.mouse.get_focused()
+
+        if Input.record_file is not None:
+            # quitting is not recorded, it would stop the replay with popups
+            frame = {'pos': Input.pos, 'pressed': Input.pressed, 'focused': Input.focused,
+                     'events': [(event.type, Input.encode(event.dict)) for event in events if event.type != QUIT]}
+            Input.record_file.write(dumps(frame)+'\n')
+
+        return events
+
+    @staticmethod
+    def encode(d):
+        """Keeps the values of an event dict that can be written as JSON"""
+        return {key: value for key, value in d.items() if value is None or type(value) in (int, float, str, bool, tuple)}
+
+    @staticmethod
+    def decode(d):
+        """JSON turned tuples, such as positions, into lists"""
+        return {key: tuple(value) if type(value) == list else value for key, value in d.items()}
+
+    @staticmethod
+    def start_recording(file):
+        Input.record_file = open(file, 'w')
+        header = {'file': graph.save_file, 'size': (Graph.W, Graph.H),
+                  'scroll': (graph.scroll_x, graph.scroll_y), 'zoom': graph.zoom}
+        Input.record_file.write(dumps(header)+'\n')
+
+    @staticmethod
+    def stop_recording():
+        Input.record_file.close()
+        Input.record_file = None
+
+    @staticmethod
+    def toggle_recording():
+        """Starts recording into a new file in the working directory, or stops recording"""
+        if Input.record_file is None:
+            file = 'recording_%s.jsonl' %strftime('%Y%m%d_%H%M%S')
+            Input.start_recording(file)
+            print('Recording input into', file)
+        else:
+            Input.stop_recording()
+            print('Recording stopped')
+
+    @staticmethod
+    def load_recording(file):
+        """Returns the header and the list of frames of a recording"""
+        with open(file) as f:
+            header = loads(f.readline())
+            frames = [loads(line) for line in f if line.strip()]
+        return header, frames
+
+    @staticmethod
+    def start_replay(frames):
+        """The recorded frames will be returned by the next calls to poll()"""
+        Input.replay = iter(frames)
+
+class Document:
+    """Objects of a graph, key: ID, value: object.
+    Manager edits the current document, a document being loaded by Loader is only swapped in once complete.
+    Several documents can be open: the state tied to the current one (journal, indexes, chunks, file and camera)
+    is stored in it when switching to another one, and restored when switching back."""
+
+    def __init__(self):
+        self.nodes = {}
+        self.links = {}
+        self.images = {}
+        self.used_images = 0 # number of images used by nodes, the ones written in save files, see Image.use
+
+        # graph state, stored while another document is current
+        self.save_file = None
+        self.scroll = (0, 0)
+        self.zoom = 1
+        self.changes = False
+        self.stored = {} # key: static class, value: {attribute: value} for its DOCUMENT_STATE attributes
+
+    def store(self):
+        """Keeps the state of the current document, before switching to another one"""
+        if graph.layout is not None: graph.stop_layout()
+        if graph.link is not None:
+            # cancel the link being created
+            Manager.delete_link(graph.link.id)
+            graph.link = None
+
+        self.stored = {cls: {name: getattr(cls, name) for name in cls.DOCUMENT_STATE}
+                       for cls in (Journal, Search, LinkIndex, Bounds, Chunks)}
+        self.save_file, self.zoom, self.changes = graph.save_file, graph.zoom, graph.changes
+        self.scroll = (graph.scroll_x, graph.scroll_y)
+
+    def restore(self):
+        """Puts back the state kept by store(), once the document is the current one again"""
+        for cls, values in self.stored.items():
+            for name, value in values.items():
+                setattr(cls, name, value)
+        graph.save_file, graph.zoom, graph.changes = self.save_file, self.zoom, self.changes
+        graph.scroll_x, graph.scroll_y = self.scroll
+
+    def close(self):
+        """Releases the shared surfaces used by the document, once it won't be used anymore"""
+        for node in self.nodes.values():
+            node.release()
+        for image in self.images.values():
+            image.release()
+
+    def sort_nodes(self):
+        """Sorts the nodes in place to display the more important ones on top"""
+        items = sorted(self.nodes.items(), key=lambda item: item[1].rank)
+        self.nodes.clear()
+        self.nodes.update(items)
+
 class Manager:
     """Manager for all objects. Should be used to create and remove new objects, as it manages the ID system."""
 
-    # key: ID, value: object
-    nodes = {}
-    links = {}
-    images = {}
+    # current document, and its objects
+    document = Document()
+    nodes = document.nodes
+    links = document.links
+    images = document.images
+
+    documents = [document] # open documents
+
+    @staticmethod
+    def use(document):
+        """Makes document the current one, adding it to the open documents. The previous document is left as it is"""
+        if document not in Manager.documents: Manager.documents.append(document)
+        Manager.document = document
+        Manager.nodes, Manager.links, Manager.images = document.nodes, document.links, document.images
+
+    @staticmethod
+    def replace(document):
+        """Closes the current document, and puts document in its place"""
+        old = Manager.document
+        Manager.documents[Manager.documents.index(old)] = document
+        Manager.use(document)
+        old.close()
 
     @staticmethod
     def new_obj(args, _class, _dict, id):
         """Adds a new object to the corresponding dictionary, assigns an ID if needed"""
         if id is None:
-            id = 0 # get the first available ID, starting at 0
+            # get the first available ID, starting at 0, or after the IDs of the chunks that are not loaded
+            id = Chunks.next_ids.get(_class, 0)
             while id in _dict: id += 1
         else: id = int(id)
 
@@ -407,25 +747,20 @@ class Manager:
     @staticmethod
     def new_node(x, y, rank, state, id=None):
         result = Manager.new_obj((float(x), float(y), int(rank), int(state)), Node, Manager.nodes, id)
-
-        # sort nodes to display the more important ones on top
-        keys = sorted(Manager.nodes.keys(), key=lambda key: Manager.nodes[key].rank)
-        copy = dict(Manager.nodes)
-        Manager.nodes = {}
-        for key in keys:
-            Manager.nodes[key] = copy[key]
-
+        Manager.document.sort_nodes()
         return result
 
     @staticmethod
     def new_link(n1, n2, id=None):
         n1 = Manager.nodes[int(n1)]
         n2 = None if n2 is None else Manager.nodes[int(n2)]
-        return Manager.new_obj((n1, n2), Link, Manager.links, id)
+        result = Manager.new_obj((n1, n2), Link, Manager.links, id)
+        Journal.changed_link(result)
+        return result
 
     @staticmethod
     def new_image(name, content, id=None):
-        return Manager.new_obj((name, content), Image, Manager.images, id)
+        return Manager.new_obj((name, content, Manager.document), Image, Manager.images, id)
 
     @staticmethod
     def attach_image(node_id, image_id):
@@ -438,10 +773,458 @@ class Manager:
         Manager.nodes[int(node_id)].set_text(text.strip())
 
     @staticmethod
-    def reset():
-        Manager.nodes = {}
-        Manager.links = {}
-        Manager.images = {}
+    def delete_node(node_id):
+        """Removes a node, along with the links attached to it"""
+        node = Manager.nodes.pop(int(node_id))
+        for link in list(node.links):
+            Manager.delete_link(link.id)
+
+        Search.remove(node)
+        node.release()
+        Journal.deleted_node(node)
+
+    @staticmethod
+    def delete_link(link_id):
+        link = Manager.links.pop(int(link_id))
+        link.detach()
+        Journal.deleted_link(link)
+
+    # bulk operations, applied to many nodes at once, refreshing each affected link only once
+
+    @staticmethod
+    def refresh_links(nodes):
+        links = set()
+        for node in nodes:
+            links.update(node.links)
+        for link in links:
+            link.refresh()
+
+    @staticmethod
+    def set_states(nodes, state=None):
+        """Sets the state of the nodes, or cycles the state of each node if state is None"""
+        for node in nodes:
+            if state is None: node.cycle_state(False)
+            else: node.set_state(state, False)
+        Manager.refresh_links(nodes)
+
+    @staticmethod
+    def set_ranks(nodes, rank=None):
+        """Sets the rank of the nodes, or cycles the rank of each node if rank is None"""
+        for node in nodes:
+            if rank is None: node.cycle_rank(False)
+            else: node.set_rank(rank, False)
+        Manager.refresh_links(nodes)
+
+    @staticmethod
+    def set_images(nodes, image):
+        """Attaches image to the nodes, or detaches their image if image is None"""
+        for node in nodes:
+            if node.image is not image: node.set_image(image)
+
+    @staticmethod
+    def set_texts(nodes, text):
+        for node in nodes:
+            if node.text != text: node.set_text(text)
+
+    @staticmethod
+    def move_nodes(nodes, dx, dy):
+        """Moves the nodes by (dx, dy) in graph coordinates"""
+        for node in nodes:
+            node.x += dx
+            node.y += dy
+            Journal.changed_node(node)
+
+    @staticmethod
+    def delete_nodes(nodes):
+        """Removes the nodes, along with the links attached to them"""
+        nodes = list(nodes)
+        links = set()
+        for node in nodes:
+            links.update(node.links)
+        for link in links:
+            Manager.delete_link(link.id)
+        for node in nodes:
+            Manager.delete_node(node.id)
+
+    @staticmethod
+    def reset(new=False, document=None):
+        """Replaces the current document with document or an empty one, or opens it next to the current one if new is True"""
+        if document is None: document = Document()
+        if new: Manager.use(document)
+        else: Manager.replace(document)
+        Search.reset()
+        LinkIndex.reset()
+        Bounds.reset()
+        Chunks.reset()
+
+class Journal:
+    """Static class, keeps track of what changed since the last save.
+    Saving an already saved file only appends these changes to a journal inside the zip file,
+    instead of rewriting every node, link and image. The journal is replayed when opening the file,
+    and it is compacted back into a full save when it grows too big.
+    The changes are also forwarded to the minimap, which only redraws the regions that changed,
+    and to the links spatial index and the bounding box."""
+
+    MAX_SIZE = 1 << 20 # journal size in bytes after which the next save rewrites the whole file
+    MAX_ENTRIES = 200 # same for the number of journal entries in the zip file
+
+    file = None # save file the journal belongs to, None if it needs a full save
+    size = 0 # size of the journal already in the save file, in bytes
+    entries = 0 # number of journal entries already in the save file
+    images = set() # IDs of the images stored in the save file
+
+    # IDs of the objects created, modified or deleted since the last save
+    nodes = set()
+    links = set()
+    removed_nodes = set()
+    removed_links = set()
+
+    recording = True # set to False while loading a file
+
+    DOCUMENT_STATE = ('file', 'size', 'entries', 'images', 'nodes', 'links', 'removed_nodes', 'removed_links')
+
+    @staticmethod
+    def reset(file, images=(), size=0, entries=0):
+        """Called after a file has been fully saved or opened, or when starting a new file"""
+        Journal.file = file
+        Journal.size = size
+        Journal.entries = entries
+        Journal.images = set(images)
+        Journal.clear()
+
+    @staticmethod
+    def clear():
+        """Forgets the changes, after they have been saved"""
+        Journal.nodes = set()
+        Journal.links = set()
+        Journal.removed_nodes = set()
+        Journal.removed_links = set()
+
+    @staticmethod
+    def can_append(file):
+        """Returns True if the changes can be appended to the journal of file instead of rewriting it"""
+        return file is not None and file == Journal.file and exists(file) and \
+            Journal.size < Journal.MAX_SIZE and Journal.entries < Journal.MAX_ENTRIES
+
+    @staticmethod
+    def changed_node(node):
+        if Journal.recording:
+            Journal.nodes.add(node.id)
+            graph.minimap.changed_node(node)
+            LinkIndex.changed_node(node)
+            Bounds.changed_node(node)
+
+    @staticmethod
+    def changed_link(link):
+        if Journal.recording:
+            Journal.links.add(link.id)
+            graph.minimap.changed_link(link)
+            LinkIndex.changed_link(link)
+
+    @staticmethod
+    def deleted_node(node):
+        if Journal.recording:
+            Journal.nodes.discard(node.id)
+            Journal.removed_nodes.add(node.id)
+            graph.minimap.changed_node(node)
+            Bounds.deleted_node(node)
+
+    @staticmethod
+    def deleted_link(link):
+        if Journal.recording:
+            Journal.links.discard(link.id)
+            Journal.removed_links.add(link.id)
+            graph.minimap.changed_link(link)
+            LinkIndex.deleted_link(link)
+
+class Search:
+    """Static class, trigram index over the nodes' text, to find the nodes containing a query quickly.
+    Queries of at least 3 characters only check the nodes having all of the query's trigrams,
+    shorter queries check every text, and refining a query only checks the previous results."""
+
+    index = {} # key: trigram, value: set of IDs of the nodes containing it
+    texts = {} # key: node ID, value: lowercase text, only for nodes with a text
+
+    indexing = True # set to False while loading a file, the loaded nodes are indexed all at once
+
+    DOCUMENT_STATE = ('index', 'texts')
+
+    @staticmethod
+    def trigrams(text):
+        return {text[i:i+3] for i in range(len(text)-2)}
+
+    @staticmethod
+    def build(nodes):
+        """Returns a new (index, texts) pair for the given nodes, without changing the current ones"""
+        index, texts = {}, {}
+        for node in nodes:
+            if not node.text: continue
+            text = texts[node.id] = node.text.lower()
+            for trigram in Search.trigrams(text):
+                if trigram in index: index[trigram].add(node.id)
+                else: index[trigram] = {node.id}
+        return index, texts
+
+    @staticmethod
+    def reset(index=None, texts=None):
+        Search.index = {} if index is None else index
+        Search.texts = {} if texts is None else texts
+
+    @staticmethod
+    def update(node):
+        """Called when the text of a node changed"""
+        if not Search.indexing: return
+
+        Search.remove(node)
+        if node.text:
+            text = Search.texts[node.id] = node.text.lower()
+            for trigram in Search.trigrams(text):
+                if trigram in Search.index: Search.index[trigram].add(node.id)
+                else: Search.index[trigram] = {node.id}
+
+    @staticmethod
+    def remove(node):
+        """Called when a node is deleted, or before its text changes"""
+        text = Search.texts.pop(node.id, None)
+        if text is None: return
+
+        for trigram in Search.trigrams(text):
+            ids = Search.index[trigram]
+            ids.discard(node.id)
+            if not len(ids): del Search.index[trigram]
+
+    @staticmethod
+    def find(query, within=None):
+        """Returns the IDs of the nodes whose text contains query, case insensitive.
+        within: IDs to check instead of the candidates from the index, when refining a previous query"""
+        query = query.lower()
+        if not query: return []
+
+        texts = Search.texts
+        if within is not None:
+            candidates = within
+        elif len(query) < 3:
+            candidates = texts.keys()
+        else:
+            # start from the rarest trigram
+            sets = sorted((Search.index.get(trigram, ()) for trigram in Search.trigrams(query)), key=len)
+            if not len(sets[0]): return []
+            candidates = set(sets[0]).intersection(*sets[1:])
+
+        return [id for id in candidates if query in texts.get(id, '')]
+
+class LinkIndex:
+    """Static class, hierarchical grid over the links' bounding boxes in graph coordinates,
+    to find the links near a position without checking every link.
+    The levels have cells of CELL * 2^lx by CELL * 2^ly graph units, so long horizontal or vertical links
+    don't end up in huge square cells. Each link is stored once, in the smallest level whose cells are
+    at least as big as its bounding box, in the cell containing the bounding box's top left corner.
+    Changes come through Journal. The changes made while the journal doesn't record
+    (chunks, automatic layout) mark the grid as dirty, and it is rebuilt when next queried."""
+
+    CELL = 4 # smallest cell size in graph units
+
+    levels = {} # key: (lx, ly), value: dict with key: (x, y) cell, value: set of links
+    link_cells = {} # key: link, value: (level, cell) containing it
+    dirty = True
+
+    DOCUMENT_STATE = ('levels', 'link_cells', 'dirty')
+
+    @staticmethod
+    def place(link):
+        """Returns the (level, cell) of a link"""
+        x0, x1 = sorted((link.n1.x, link.n2.x))
+        y0, y1 = sorted((link.n1.y, link.n2.y))
+        c = LinkIndex.CELL
+        lx = max(0, ceil(log2(max(x1-x0, 1e-9)/c)))
+        ly = max(0, ceil(log2(max(y1-y0, 1e-9)/c)))
+        return (lx, ly), (floor(x0/(c << lx)), floor(y0/(c << ly)))
+
+    @staticmethod
+    def build(links):
+        """Returns a new (levels, link_cells) pair for the given links, without changing the current ones"""
+        levels, link_cells = {}, {}
+        for link in links:
+            if link.n2 is None: continue # being created
+            level, cell = link_cells[link] = LinkIndex.place(link)
+            cells = levels.get(level)
+            if cells is None: cells = levels[level] = {}
+            if cell in cells: cells[cell].add(link)
+            else: cells[cell] = {link}
+        return levels, link_cells
+
+    @staticmethod
+    def reset(levels=None, link_cells=None):
+        """Sets the index built by LinkIndex.build, or marks it as dirty if not given"""
+        LinkIndex.levels = {} if levels is None else levels
+        LinkIndex.link_cells = {} if link_cells is None else link_cells
+        LinkIndex.dirty = levels is None
+
+    @staticmethod
+    def add(link):
+        if link.n2 is None: return
+
+        level, cell = LinkIndex.link_cells[link] = LinkIndex.place(link)
+        cells = LinkIndex.levels.get(level)
+        if cells is None: cells = LinkIndex.levels[level] = {}
+        if cell in cells: cells[cell].add(link)
+        else: cells[cell] = {link}
+
+    @staticmethod
+    def remove(link):
+        level, cell = LinkIndex.link_cells.pop(link, (None, None))
+        if level is None: return
+
+        cells = LinkIndex.levels[level]
+        cells[cell].discard(link)
+        if not len(cells[cell]): del cells[cell]
+
+    @staticmethod
+    def changed_node(node):
+        if LinkIndex.dirty: return
+        for link in node.links:
+            LinkIndex.remove(link)
+            LinkIndex.add(link)
+
+    @staticmethod
+    def changed_link(link):
+        if LinkIndex.dirty: return
+        LinkIndex.remove(link)
+        LinkIndex.add(link)
+
+    @staticmethod
+    def deleted_link(link):
+        if not LinkIndex.dirty: LinkIndex.remove(link)
+
+    @staticmethod
+    def query(x0, y0, x1, y1):
+        """Returns the set of links whose bounding box may intersect the given rectangle, in graph coordinates"""
+        if LinkIndex.dirty: LinkIndex.reset(*LinkIndex.build(Manager.links.values()))
+
+        result = set()
+        c = LinkIndex.CELL
+        for (lx, ly), cells in LinkIndex.levels.items():
+            # the boxes are at most one cell big, they can start in the cells before the rectangle
+            sx, sy = c << lx, c << ly
+            cx0, cy0, cx1, cy1 = floor(x0/sx)-1, floor(y0/sy)-1, floor(x1/sx), floor(y1/sy)
+            if (cx1-cx0+1)*(cy1-cy0+1) < len(cells):
+                for cx in range(cx0, cx1+1):
+                    for cy in range(cy0, cy1+1):
+                        links = cells.get((cx, cy))
+                        if links is not None: result.update(links)
+            else:
+                # fewer filled cells than cells in the rectangle
+                for (cx, cy), links in cells.items():
+                    if cx0 <= cx <= cx1 and cy0 <= cy <= cy1: result.update(links)
+        return result
+
+class Bounds:
+    """Static class, bounding box of the nodes and their full text in graph coordinates, used to size the exports
+    and to fit the graph on screen. It grows with the changes coming through Journal, using the box of each node:
+    when a node on the edge of the bounding box moves inwards or is deleted, it is only marked as dirty,
+    and recomputed from the boxes of the nodes when next needed.
+    Save files store it, so opening a file doesn't need the boxes of the nodes until a node changes.
+    The changes made while the journal doesn't record (chunks, automatic layout) reset it."""
+
+    box = None # (x0, y0, x1, y1), None if there are no nodes
+    extents = None # key: node, value: its box, None if not computed since the last reset
+    dirty = True
+
+    DOCUMENT_STATE = ('box', 'extents', 'dirty')
+
+    @staticmethod
+    def extent(node):
+        """Returns the box (x0, y0, x1, y1) of a node with its full text, as drawn in exports"""
+        if node.text_surfs is None: w = h = 0
+        else: w, h = node.text_surfs[1].get_size()
+
+        offsettop = node.size/2/Graph.unit_size
+        offsetx = max(offsettop, w/2/Graph.unit_size)
+        offsetbtm = offsettop + (5+h)/Graph.unit_size
+        return node.x-offsetx, node.y-offsettop, node.x+offsetx, node.y+offsetbtm
+
+    @staticmethod
+    def union(boxes):
+        """Returns the box containing all the boxes, None if there are none"""
+        boxes = list(boxes)
+        if not len(boxes): return None
+        x0, y0, x1, y1 = zip(*boxes)
+        return min(x0), min(y0), max(x1), max(y1)
+
+    @staticmethod
+    def build(nodes):
+        """Returns (box, extents) for the given nodes, to be passed to reset()"""
+        extents = {node: Bounds.extent(node) for node in nodes}
+        return Bounds.union(extents.values()), extents
+
+    @staticmethod
+    def reset(box=None, extents=None):
+        """Sets a box built by build() or read from a save file, or marks it as dirty if there is none"""
+        Bounds.box = box
+        Bounds.extents = extents
+        Bounds.dirty = box is None and extents is None
+
+    @staticmethod
+    def changed_node(node):
+        if Bounds.extents is None:
+            # the previous box of the node is not known
+            Bounds.dirty = True
+            return
+
+        old = Bounds.extents.get(node)
+        new = Bounds.extents[node] = Bounds.extent(node)
+        if Bounds.dirty: return
+        if Bounds.box is None:
+            Bounds.box = new
+            return
+
+        x0, y0, x1, y1 = Bounds.box
+        if old is not None and (old[0] <= x0 < new[0] or old[1] <= y0 < new[1] or
+                                old[2] >= x1 > new[2] or old[3] >= y1 > new[3]):
+            Bounds.dirty = True
+        else: Bounds.box = min(x0, new[0]), min(y0, new[1]), max(x1, new[2]), max(y1, new[3])
+
+    @staticmethod
+    def deleted_node(node):
+        if Bounds.extents is None:
+            Bounds.dirty = True
+            return
+
+        old = Bounds.extents.pop(node, None)
+        if Bounds.dirty or old is None: return
+        x0, y0, x1, y1 = Bounds.box
+        if old[0] <= x0 or old[1] <= y0 or old[2] >= x1 or old[3] >= y1: Bounds.dirty = True
+
+    @staticmethod
+    def get():
+        """Returns the bounding box (x0, y0, x1, y1) of the nodes, or None if there are no nodes"""
+        if Bounds.dirty:
+            if Bounds.extents is None: Bounds.box, Bounds.extents = Bounds.build(Manager.nodes.values())
+            else: Bounds.box = Bounds.union(Bounds.extents.values())
+            Bounds.dirty = False
+        return Bounds.box
+
+class SharedCache:
+    """Reference counted cache, shared by the objects of all the open documents.
+    A value is made when its key is first acquired, and dropped when the last object using it releases it."""
+
+    def __init__(self):
+        self.entries = {} # key: [value, number of users]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def acquire(self, key, make):
+        """Returns the value for key, calling make() to create it if it isn't cached"""
+        entry = self.entries.get(key)
+        if entry is None: entry = self.entries[key] = [make(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, key):
+        entry = self.entries[key]
+        entry[1] -= 1
+        if not entry[1]: del self.entries[key]
 
 class GraphObject:
     def update(self, events):
@@ -456,6 +1239,13 @@ class Node(GraphObject):
     rank_sizes = [40, 50, 60, 80, 100]
     assert len(rank_sizes) == N_RANKS
 
+    COMPLETED = 2 # index of the completed state
+    TEXT_WIDTH = 100 # max width of the full text in pixels, longer texts are wrapped
+
+    # surfaces shared by the nodes with the same look, never modified once drawn
+    surfs_cache = SharedCache() # key: (size, state, image surface), value: box surfaces
+    texts_cache = SharedCache() # key: text, value: text surfaces
+
     def __init__(self, x, y, rank, state, id):
         self.x = x
         self.y = y
@@ -464,6 +1254,10 @@ class Node(GraphObject):
 
         self.text = ''
         self.image = None # image, None for no image
+        self.links = [] # attached links
+        # number of prerequisites (first nodes of the links whose second node is this one) not completed,
+        # kept up to date by links and state changes
+        self.pending = 0
 
         # on init and when changing zoom, cache the scaled surfaces
         self.cached_surfs = None
@@ -473,6 +1267,7 @@ class Node(GraphObject):
         # if text, will contain [shortened text, full text (on hover/selection)]
         self.text_surfs = None
         self.size = None # should contain the size according to self.rank
+        self.surfs_key = None # key of self.surfs in Node.surfs_cache
 
         self.set_rank(rank) # init self.rank, self.size and self.surfs
 
@@ -482,28 +1277,47 @@ class Node(GraphObject):
         rank = min(max(rank, 0), Node.N_RANKS-1)
         return Node.rank_sizes[rank]
 
-    def set_rank(self, rank):
+    def set_rank(self, rank, refresh=True):
+        """Sets the rank and size, updates the surfaces and the attached links,
+        unless refresh is False (bulk operations refresh each link once, see Manager)"""
         self.rank = rank
         self.size = Node.get_rank_size(rank)
         self.set_image(self.image)
 
         # update attached links
-        for link in Manager.links.values():
-            if self == link.n1 or self == link.n2:
+        if refresh:
+            for link in self.links:
                 link.refresh()
 
-    def cycle_rank(self):
-        self.set_rank((self.rank+1) % Node.N_RANKS)
+    def cycle_rank(self, refresh=True):
+        self.set_rank((self.rank+1) % Node.N_RANKS, refresh)
 
-    def cycle_state(self):
+    def cycle_state(self, refresh=True):
         # order: todo, completed, doing
-        self.state = (self.state-1) % 3
+        self.set_state((self.state-1) % 3, refresh)
+
+    def set_state(self, state, refresh=True):
+        """Sets the state, updates the surfaces, the attached links (unless refresh is False)
+        and the next nodes' availability"""
+        completed = self.state == Node.COMPLETED
+        self.state = state
+
+        # only the next nodes' availability depends on this node's state
+        if completed != (state == Node.COMPLETED):
+            for link in self.links:
+                if link.n1 == self and link.n2 is not None:
+                    link.n2.pending += 1 if completed else -1
+
         self.set_image(self.image) # update self._surf
 
-        for link in Manager.links.values():
-            if self == link.n1 or self == link.n2:
+        if refresh:
+            for link in self.links:
                 link.refresh()
 
+    def available(self):
+        """Returns True if the node is not completed but all its prerequisites are"""
+        return self.state != Node.COMPLETED and not self.pending
+
     @staticmethod
     def black_back(surf):
         """Adds a semi-transparent Palette.background background to a surface"""
@@ -517,70 +1331,79 @@ class Node(GraphObject):
 
         return new
 
-    def set_text(self, text):
-        """Sets the node's text and updates its text Surface"""
-        self.text = text
-        if text == '':
-            self.text_surfs = None
-        else:
-            max_width = 100
-            if len(text)*char_w2 > max_width:
-                # make unselected surface: cut text
-                surf = font2.render(text[:int(max_width/char_w2)-3]+'...', True, Palette.text)
-                self.text_surfs = [Node.black_back(surf), None]
-
-                # make selected surface: word wrap if necessary
-                # get words and split them if bigger than max_width
-                words = []
-                for word in text.split(' '):
-                    while len(word)*char_w2 > max_width:
-                        i = int(max_width/char_w2)-1
-                        add, word = word[:i]+'-', word[i:]
-                        words.append(add)
-                    words.append(word)
-
-                lines = ['']
-                i = 0
-                for word in words:
-                    space = ' ' if lines[i] else ''
-                    if len(lines[i]+space+word) * char_w2 > max_width:
-                        if lines[i] == '':
-                            lines[i] += word
-                            lines.append('')
-                        else: lines.append(word)
-                        i += 1
-                    else:
-                        lines[i] += space+word
+    @staticmethod
+    def wrap_text(text):
+        """Splits a text into lines fitting in Node.TEXT_WIDTH pixels, cutting the words that are too long"""
+        max_width = Node.TEXT_WIDTH
+
+        # get words and split them if bigger than max_width
+        words = []
+        for word in text.split(' '):
+            while len(word)*char_w2 > max_width:
+                i = int(max_width/char_w2)-1
+                add, word = word[:i]+'-', word[i:]
+                words.append(add)
+            words.append(word)
+
+        lines = ['']
+        i = 0
+        for word in words:
+            space = ' ' if lines[i] else ''
+            if len(lines[i]+space+word) * char_w2 > max_width:
+                if lines[i] == '':
+                    lines[i] += word
+                    lines.append('')
+                else: lines.append(word)
+                i += 1
+            else:
+                lines[i] += space+word
 
-                # assemble lines into one surface
-                width = len(max(lines, key=lambda l: len(l)))*char_w2
-                surf = pygame.Surface((width, 12*len(lines)), SRCALPHA)
-                for y, line in enumerate(lines):
-                    line = font2.render(line, True, Palette.text)
-                    surf.blit(line, (width/2 - line.get_width()/2, y*12))
+        return lines
 
-                self.text_surfs[1] = Node.black_back(surf)
-            else:
-                # same text for both unselected and selected
-                surf = Node.black_back(font2.render(text, True, Palette.text))
-                self.text_surfs = [surf, surf]
+    @staticmethod
+    def render_text(text):
+        """Returns the [shortened text, full text] surfaces of a text"""
+        max_width = Node.TEXT_WIDTH
+        if len(text)*char_w2 > max_width:
+            # make unselected surface: cut text
+            short = Node.black_back(font2.render(text[:int(max_width/char_w2)-3]+'...', True, Palette.text))
 
-    def set_image(self, image):
-        """Sets and resizes self.surfs depending on self.size"""
-        s = self.size
-        self.image = image
-        self.cached_surfs = None # force cached surfaces refresh
-        self.cached_zoom = None
-        self.surfs = [None]*3
+            # make selected surface: word wrap if necessary
+            lines = Node.wrap_text(text)
 
-        # draw empty box
+            # assemble lines into one surface
+            width = len(max(lines, key=lambda l: len(l)))*char_w2
+            surf = pygame.Surface((width, 12*len(lines)), SRCALPHA)
+            for y, line in enumerate(lines):
+                line = font2.render(line, True, Palette.text)
+                surf.blit(line, (width/2 - line.get_width()/2, y*12))
+
+            return [short, Node.black_back(surf)]
+
+        # same text for both unselected and selected
+        surf = Node.black_back(font2.render(text, True, Palette.text))
+        return [surf, surf]
+
+    def set_text(self, text):
+        """Sets the node's text and updates its text Surface"""
+        if self.text_surfs is not None: Node.texts_cache.release(self.text)
+        self.text = text
+        self.text_surfs = None if text == '' else Node.texts_cache.acquire(text, lambda: Node.render_text(text))
+        Journal.changed_node(self) # after setting text_surfs, that are part of the node's bounds
+        Search.update(self)
+
+    @staticmethod
+    def draw_box(s, state, image):
+        """Returns the normal, hovered and selected surfaces of a node box of size s, with the image in it"""
+        surfs = [None]*3
         m = int(s/10) # outline margin
 
+        # draw empty box
         for i in range(3): # set normal, hovered, and selected surfaces
-            self.surfs[i] = pygame.Surface((s, s))
-            self.surfs[i].fill(Palette.box_outer[self.state][i])
-            pygame.draw.rect(self.surfs[i], Palette.box_sep[self.state][i], Rect(m-2, m-2, s - m*2 + 4, s - m*2 + 4))
-            pygame.draw.rect(self.surfs[i], Palette.box_inner[self.state][i], Rect(m, m, s - m*2, s - m*2))
+            surfs[i] = pygame.Surface((s, s))
+            surfs[i].fill(Palette.box_outer[state][i])
+            pygame.draw.rect(surfs[i], Palette.box_sep[state][i], Rect(m-2, m-2, s - m*2 + 4, s - m*2 + 4))
+            pygame.draw.rect(surfs[i], Palette.box_inner[state][i], Rect(m, m, s - m*2, s - m*2))
 
         # if image, resize it and add it to the surface
         if image is not None:
@@ -591,7 +1414,35 @@ class Node(GraphObject):
 
             image = pygame.transform.scale(image.surf, (w, h))
             for i in range(3):
-                self.surfs[i].blit(image, (m+1, m+1))
+                surfs[i].blit(image, (m+1, m+1))
+        return surfs
+
+    def set_image(self, image):
+        """Sets and resizes self.surfs depending on self.size"""
+        s = self.size
+        if image is not self.image:
+            if self.image is not None: self.image.use(-1)
+            if image is not None: image.use(1)
+        self.image = image
+        Journal.changed_node(self) # also called when changing rank or state
+        self.cached_surfs = None # force cached surfaces refresh
+        self.cached_zoom = None
+
+        # images with the same content share their surface, even in different documents
+        key = (s, self.state, None if image is None else image.surf)
+        if key == self.surfs_key: return
+        self.surfs = Node.surfs_cache.acquire(key, lambda: Node.draw_box(s, self.state, image))
+        if self.surfs_key is not None: Node.surfs_cache.release(self.surfs_key)
+        self.surfs_key = key
+
+    def release(self):
+        """Releases the shared surfaces and the image, when the node is deleted or its document closed"""
+        if self.image is not None: self.image.use(-1)
+        if self.text_surfs is not None: Node.texts_cache.release(self.text)
+        if self.surfs_key is not None: Node.surfs_cache.release(self.surfs_key)
+        self.text_surfs = None
+        self.surfs_key = None
+        self.image = None
 
     def collide(self, pos):
         """Checks if the given position in screen coordinates intersects with the node"""
@@ -599,15 +1450,17 @@ class Node(GraphObject):
         s = self.size/2
         return x-s < pos[0] < x+s and y-s < pos[1] < y+s
 
-    def visible(self):
-        """Returns True if visible, taking scroll and zoom into account, otherwise returns False"""
-        x, y = graph.project(self.x, self.y)
+    def visible(self, project=None):
+        """Returns True if visible, taking scroll and zoom into account, otherwise returns False.
+        project: projector to use instead of graph.project"""
+        x, y = (project or graph.project)(self.x, self.y)
         s = self.size/2
         return -s <= x < Graph.W+s and -s <= y < Graph.H+s
 
     def update(self, events, surf, project, force_text=False):
         """Called by grah update() each frame. Blits a surface onto surf at the position given by the projector.
-        The text is cut when not hovered/selected, but this can be overriden by setting force_text to True"""
+        The text is cut when not hovered/selected, but this can be overriden by setting force_text to True,
+        or hidden by setting it to None"""
         x, y = project(self.x, self.y)
 
         s = self.size if graph.zoom > 1 else self.size*graph.zoom
@@ -615,13 +1468,16 @@ class Node(GraphObject):
         # refresh cached surfaces if needed
         if self.cached_zoom != graph.zoom:
             self.cached_surfs = [pygame.transform.smoothscale(surf, (s, s)) for surf in self.surfs]
+            self.cached_zoom = graph.zoom
+            graph.profiler.cache(False)
+        else: graph.profiler.cache(True)
 
         # use a different texture when hovered
-        i = 2 if self in graph.selection else 1 if self == graph.hovered else 0
+        i = 2 if self in graph.selected else 1 if self == graph.hovered else 0
         surf.blit(self.cached_surfs[i], (x - s/2, y - s/2))
 
         # draw text
-        if self.text_surfs is not None:
+        if self.text_surfs is not None and force_text is not None:
             t = self.text_surfs[force_text or bool(i)]
             surf.blit(t, (x - t.get_width()/2, y + s/2 + 5))
 
@@ -634,11 +1490,26 @@ class Link(GraphObject):
     def __init__(self, n1, n2, id):
         self.id = id
 
-        # linked nodes
+        # linked nodes, n1 being a prerequisite of n2
         self.n1 = n1
-        self.n2 = n2 # can be None if just created
-
-        self.refresh() # set self.rank, self.size and self.state
+        self.n2 = None # can be None if just created
+        n1.links.append(self)
+        if n2 is None: self.refresh() # set self.rank, self.size and self.state
+        else: self.attach(n2)
+
+    def attach(self, n2):
+        """Attaches the second end of a link that was being created"""
+        self.n2 = n2
+        n2.links.append(self)
+        if self.n1.state != Node.COMPLETED: n2.pending += 1
+        self.refresh()
+
+    def detach(self):
+        """Removes the link from its nodes' links, when deleting it"""
+        self.n1.links.remove(self)
+        if self.n2 is not None:
+            self.n2.links.remove(self)
+            if self.n1.state != Node.COMPLETED: self.n2.pending -= 1
 
     @staticmethod
     def get_rank_size(rank):
@@ -657,89 +1528,867 @@ class Link(GraphObject):
         else: self.state = max(self.n1.state, self.n2.state)
 
     def collide(self, mpos):
-        """Checks if the link collides with the mouse, with self.size tolerance.
-        How it works:
-        Let p1 and p2 be the two link end points once projected into screen space, and M the mouse pos.
-        Let (D) be the line between p1 and p2, and M' the approximation of M projected onto (D).
-        M' is hence the point in (D) that is at the same distance from p1 as M.
-
-        The goal of this method is to compute the distance (squared) between M' and M,
-        and compare it to self.size (squared). If the former is smaller, a collision is registered.
-
-        During the calculation, we compute t, directional vector of (D). If t is not in [0, 1],
-        the projected point is outside the segment of (D) that sits between p1 and p2,
-        hence there is no collision in this case.
-
-        In case p1 == p2, the line formed by the link is treated as a circle of radius self.size
-        for collision checks. This shouldn't usually matter as the ends of the links are nodes
-        and their collision detection runs first in Graph.update.
-        """
-        x1, y1 = graph.project(self.n1.x, self.n1.y)
-        x2, y2 = graph.project(self.n2.x, self.n2.y)
+        """Checks if the link collides with the mouse, with self.size tolerance"""
+        return Link.closest([self], mpos) is self
+
+    @staticmethod
+    def closest(links, mpos):
+        """Returns the link closest to the mouse among links, if it is closer than its size, otherwise None.
+        The distance is computed in screen space, between the mouse position M and the segment [p1 p2]:
+        M is projected onto the line (p1 p2) at p1 + t*(p2-p1), with t clamped to [0, 1] to stay on the segment.
+        A link whose ends are at the same position is treated as a point."""
+        z = graph.zoom * Graph.unit_size
+        ox, oy = Graph.W/2 - graph.scroll_x*z, Graph.H/2 - graph.scroll_y*z
         xm, ym = mpos
-        s2 = self.size*self.size
-        if x1 == x2 and y1 == y2:
-            dx, dy = xm-x1, ym-y1
-            return dx*dx + dy*dy <= s2
 
-        # calculate t
-        dx, dy = xm-x1, ym-y1
-        p1_m = dx*dx + dy*dy
-        dx, dy = x2-x1, y2-y1
-        p1_p2 = dx*dx + dy*dy
-        t = sqrt(p1_m/p1_p2)
-        if t < 0 or t > 1: return False
+        result, best = None, None
+        for link in links:
+            x1, y1 = link.n1.x*z + ox, link.n1.y*z + oy
+            x2, y2 = link.n2.x*z + ox, link.n2.y*z + oy
+            dx, dy = x2-x1, y2-y1
+            length2 = dx*dx + dy*dy
+            t = 0 if length2 == 0 else min(max(((xm-x1)*dx + (ym-y1)*dy) / length2, 0), 1)
+
+            dx, dy = xm - x1 - dx*t, ym - y1 - dy*t
+            d2 = dx*dx + dy*dy
+            if d2 <= link.size*link.size and (best is None or d2 < best):
+                result, best = link, d2
+        return result
 
-        # calculate M' position
-        xm2, ym2 = x1 + dx*t, y1 + dy*t
+    def crosses(self, x0, y0, x1, y1):
+        """Checks if the link's segment intersects the rectangle, in graph coordinates:
+        the bounding boxes have to overlap, and the rectangle's corners can't all be on the same side of the link"""
+        ax, ay, bx, by = self.n1.x, self.n1.y, self.n2.x, self.n2.y
+        if max(ax, bx) < x0 or min(ax, bx) > x1 or max(ay, by) < y0 or min(ay, by) > y1: return False
 
-        dx, dy = xm-xm2, ym-ym2
-        return dx*dx + dy*dy <= s2
+        dx, dy = bx-ax, by-ay
+        sides = [dx*(y-ay) - dy*(x-ax) for x, y in ((x0, y0), (x1, y0), (x0, y1), (x1, y1))]
+        return min(sides) <= 0 <= max(sides)
 
-    def update(self, events, surf, project):
-        """Called by grah update() each frame. Draws a line onto surf at the position given by the projector."""
+    def update(self, events, surf, project, project2=None):
+        """Called by grah update() each frame. Draws a line onto surf at the position given by the projector.
+        A different projector can be given for the second node with project2, e.g. if only one of the nodes is dragged."""
 
         # get end nodes screen coordinates
         pos1 = project(self.n1.x, self.n1.y)
         if self.n2 is None:
             # the link is currently being drawn
-            pos2 = pygame.mouse.get_pos()
-        else: pos2 = project(self.n2.x, self.n2.y)
+            pos2 = Input.pos
+        else: pos2 = (project2 or project)(self.n2.x, self.n2.y)
+
+        # get color depending on if the link is hovered/selected
+        i = 2 if self in graph.selected else 1 if self == graph.hovered else 0
+        col = Palette.link[self.state][i]
+        col2 = Palette.link2[self.state][i]
+
+        # get the actually displayed size and decide if need to draw a center line
+        s = self.size if graph.zoom > 1 else self.size*graph.zoom
+
+        pygame.draw.line(surf, col, pos1, pos2, 1 if s < 1 else int(s))
+        if s >= 3: pygame.draw.line(surf, col2, pos1, pos2, int(s/3))
+
+class Image:
+    """Pygame surface loaded from image file.
+    The stored path is cut to the base name, to then be cached in the save zip file."""
+
+    # decoded surfaces of the images loaded from save files, shared by the images with the same content
+    # in all the open documents. Key: hash of the content
+    surfs_cache = SharedCache()
+
+    MAX_SIZE = max(Node.rank_sizes) # imported images are downscaled to fit in the biggest node
+
+    def __init__(self, path, content, document, id):
+        """Loads an image of document from the save zip file (content is a bytes array),
+        from a surface returned by Image.load_file (content is that surface)
+        or from the disk (content is None, and path is used to load the image)"""
+
+        self.path = basename(path).replace(' ', '_')
+        self.name = splitext(self.path)[0]
+        self.key = None # key in Image.surfs_cache, None if not shared
+        self.thumbnail = None # see get_thumbnail
+        self.document = document
+        self.users = 0 # number of nodes using the image, kept up to date by Node.set_image
+        if content is None:
+            # load image from disk
+            self.surf = pygame.image.load(path).convert_alpha()
+        elif isinstance(content, pygame.Surface):
+            self.surf = content.convert_alpha()
+        else:
+            self.key = blake2b(content, digest_size=16).digest()
+            self.surf = Image.surfs_cache.acquire(self.key, lambda: Image.decode(content))
+        self.id = id
+
+    def use(self, n):
+        """Adds n to the number of nodes using the image, counting the images used in its document"""
+        used = bool(self.users)
+        self.users += n
+        self.document.used_images += bool(self.users) - used
+
+    @staticmethod
+    def load_file(file):
+        """Decodes an image file, downscaled to fit in MAX_SIZE. Runs on the import threads,
+        the surface is then converted to the display format by the constructor, on the main thread."""
+        surf = pygame.image.load(file)
+        w, h = surf.get_size()
+        m = Image.MAX_SIZE
+        if w > m or h > m:
+            if w > h: w, h = m, max(round(m*h/w), 1)
+            else: w, h = max(round(m*w/h), 1), m
+            # smoothscale only supports 24 and 32 bits surfaces
+            scale = pygame.transform.smoothscale if surf.get_bitsize() in (24, 32) else pygame.transform.scale
+            surf = scale(surf, (w, h))
+        return surf
+
+    @staticmethod
+    def decode(content):
+        """Returns the surface of an image file stored in a save file"""
+        # get the width, height, and image data from content
+        i = content.index(b'.')
+        w = int(content[:i].decode())
+        content = content[i+1:]
+        i = content.index(b'.')
+        h = int(content[:i].decode())
+        content = content[i+1:]
+        return pygame.image.frombytes(content, (w, h), 'RGBA')
+
+    def get_thumbnail(self):
+        """Returns the image resized to fit in 50x50 pixels, for the image selector. Made on the first call"""
+        if self.thumbnail is None:
+            w, h = self.surf.get_size()
+            if w > h: w, h = 50, 50*h/w
+            else: w, h = 50*w/h, 50
+            self.thumbnail = pygame.transform.scale(self.surf, (w, h))
+        return self.thumbnail
+
+    def release(self):
+        """Releases the shared surface, when the image's document is closed"""
+        if self.key is not None: Image.surfs_cache.release(self.key)
+        self.key = None
+
+    def encode(self):
+        """Returns the content of the image file stored in the save zip file"""
+        w, h = self.surf.get_size()
+        return b'%d.%d.%s' %(w, h, pygame.image.tostring(self.surf, 'RGBA'))
+
+class Loader:
+    """Loads a save file on a worker thread, into a new document.
+    This way the window keeps being updated while loading, and the document
+    only replaces the current one in Manager once the whole file was loaded successfully."""
+
+    def __init__(self, save_file):
+        self.save_file = save_file
+
+        # loaded objects, key: ID, value: object
+        self.document = Document()
+        self.nodes = self.document.nodes
+        self.links = self.document.links
+        self.images = self.document.images
+        self.image_ids = [] # IDs of the images stored in the file
+
+        # camera position and zoom, None if not in the file
+        self.scroll = None
+        self.zoom = None
+
+        self.journal_size = 0
+        self.journal_entries = 0
+        self.search = None # (index, texts) of the loaded nodes, see Search.build
+        self.link_index = None # (levels, link_cells) of the loaded links, see LinkIndex.build
+        self.bounds = None # (box, extents) of the loaded nodes, see Bounds.build
+
+        self.progress = 0 # between 0 and 1
+        self.success = True
+        self.cancelled = False
+        # popups can only be displayed from the main thread: (function, args) pairs to call once loaded
+        self.errors = []
+
+        self.thread = Thread(target=self.load, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    def cancel(self):
+        """Stops loading as soon as possible, the loaded objects will be discarded"""
+        self.cancelled = True
+        self.success = False
+
+    def error(self, function, *args):
+        """Registers an error popup, to be displayed by the main thread"""
+        self.errors.append((function, args))
+
+    def set_node(self, x, y, rank, state, id):
+        """Updates the node with the given ID, or creates it if it doesn't exist yet (journal entries)"""
+        id = int(id)
+        node = self.nodes.get(id)
+        if node is None:
+            self.nodes[id] = Node(float(x), float(y), int(rank), int(state), id)
+        else:
+            node.x, node.y = float(x), float(y)
+            node.set_state(int(state))
+            node.set_rank(int(rank))
+
+    def new_link(self, n1, n2, id):
+        id = int(id)
+        self.links[id] = Link(self.nodes[int(n1)], self.nodes[int(n2)], id)
+
+    def delete_node(self, id):
+        node = self.nodes.pop(id)
+        for link in list(node.links):
+            self.links.pop(link.id).detach()
+        node.release()
+
+    def load(self):
+        """Reads and parses the save file, then its journal. Runs on the worker thread."""
+
+        format = Formats.get(self.save_file)
+        if format is not None:
+            self.import_file(format)
+            return
+
+        try:
+            sources = [] # (file name, lines) pairs: the save file, then the journal entries in order
+
+            other_files = {} # file name: content
+            with ZipFile(self.save_file) as z:
+                total = sum(info.file_size for info in z.filelist) or 1
+                read = 0
+
+                sources.append(('save.txt', z.read('save.txt').decode().split('\n')))
+                journal = []
+                for info in z.filelist:
+                    if self.cancelled: return
+                    file = info.filename
+                    if file.startswith('journal/'):
+                        journal.append(file)
+                    elif file.startswith('stats/'):
+                        self.journal_size += info.file_size
+                    elif file != 'save.txt' and not file.startswith('preview'):
+                        other_files[file] = z.read(file)
+                    read += info.file_size
+                    self.progress = 0.5*read/total
+
+                for file in sorted(journal):
+                    content = z.read(file)
+                    self.journal_size += len(content)
+                    sources.append((file, content.decode().split('\n')))
+                self.journal_entries = len(journal)
+
+        except Exception as e:
+            self.error(Error.zipfile, e)
+            self.success = False
+            return
+
+        # flatten the lines of all sources, keeping track of where they come from for error messages
+        lines = [(source, y, raw) for source, content in sources for y, raw in enumerate(content)]
+        bounds = None # (box, source) of the last _B command
+        for i, (source, y, raw) in enumerate(lines):
+            if self.cancelled: return
+            self.progress = 0.5 + 0.5*i/len(lines)
+
+            # format line: remove leading and trailing spaces, double spaces, comments
+            line = ''
+            prev = ' '
+            for c in raw:
+                if c == prev == ' ': continue
+                if c == '#': break
+                line += c
+                prev = c
+            line = line.rstrip()
+            if not line: continue
+
+            # get command from line
+            line = line.split(' ')
+            cmd = line[0]
+            args = line[1:]
+
+            # execute action depending on command
+            match cmd:
+                case 'P': # add new node
+                    if len(args) != 5:
+                        self.error(Error.syntax, y, raw, source)
+                        self.success = False
+                    try:
+                        self.set_node(*args)
+                    except:
+                        self.error(Error.corrupted_file, 'wrong node values: '+raw, self.success)
+                case 'L': # add new link
+                    if len(args) != 3:
+                        self.error(Error.syntax, y, raw, source)
+                        self.success = False
+                    try:
+                        self.new_link(*args)
+                    except:
+                        self.error(Error.corrupted_file, 'wrong link values: '+raw, self.success)
+                case 'I': # add new image
+                    if len(args) != 2:
+                        self.error(Error.syntax, y, raw, source)
+                        self.success = False
+                    try:
+                        name, id = args
+                        content = other_files[name]
+                        self.images[int(id)] = Image(name, content, self.document, int(id))
+                        self.image_ids.append(int(id))
+                    except:
+                        self.error(Error.corrupted_file, 'wrong image values: '+raw, self.success)
+                        self.success = False
+                case 'Ai': # attach an image to a node
+                    if len(args) != 2:
+                        self.error(Error.syntax, y, raw, source)
+                        self.success = False
+                    try:
+                        self.nodes[int(args[0])].set_image(self.images[int(args[1])])
+                    except:
+                        self.error(Error.corrupted_file, 'error while attaching image: '+raw, self.success)
+                        self.success = False
+                case 'At': # attach text to a node
+                    if len(args) != 2:
+                        self.error(Error.syntax, y, raw, source)
+                        self.success = False
+                    try:
+                        self.nodes[int(args[0])].set_text(args[1].replace('\0', ' ').strip())
+                    except:
+                        self.error(Error.corrupted_file, 'error while attaching text: '+raw, self.success)
+                        self.success = False
+
+                # journal-only commands, deleting objects or detaching images and text from nodes
+                case 'Dn' | 'Dl' | 'Di' | 'Dt':
+                    if len(args) != 1:
+                        self.error(Error.syntax, y, raw, source)
+                        self.success = False
+                    try:
+                        id = int(args[0])
+                        if cmd == 'Dn':
+                            if id in self.nodes: self.delete_node(id)
+                        elif cmd == 'Dl':
+                            if id in self.links: self.links.pop(id).detach()
+                        elif cmd == 'Di': self.nodes[id].set_image(None)
+                        else: self.nodes[id].set_text('')
+                    except:
+                        self.error(Error.corrupted_file, 'error while replaying the journal: '+raw, self.success)
+
+                case '_S':
+                    if len(args) != 2:
+                        self.error(Error.syntax, y, raw, source)
+                        self.success = False
+                    try:
+                        self.scroll = float(args[0]), float(args[1])
+                    except:
+                        self.error(Error.corrupted_file, 'invalid scroll position', self.success)
+                case '_Z':
+                    if len(args) != 1:
+                        self.error(Error.syntax, y, raw, source)
+                        self.success = False
+                    try:
+                        self.zoom = float(args[0])
+                    except:
+                        self.error(Error.corrupted_file, 'invalid zoom value', self.success)
+                    if not self.zoom: # forbidden value: reset zoom
+                        self.zoom = 1
+                case '_B':
+                    # only valid if written by the last source, other changes might have been made since
+                    try:
+                        box = tuple(map(float, args))
+                        if len(box) == 4: bounds = box, source
+                    except ValueError: pass
+                case _:
+                    self.error(Error.syntax, y, raw, source)
+                    self.success = False
+
+            if not self.success: break
+
+        self.finish(bounds[0] if bounds is not None and bounds[1] == sources[-1][0] else None)
+
+    def import_file(self, format):
+        """Reads a file in one of the formats of Formats, streaming it through an Importer"""
+        try:
+            with open(self.save_file, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size or 1
+                importer = Importer(self)
+                for _ in format.read(f, importer):
+                    if self.cancelled: return
+                    self.progress = f.tell()/size
+                importer.finish()
+        except Exception as e:
+            self.error(Error.import_file, e)
+            self.success = False
+            return
+
+        self.finish()
+
+    def finish(self, box=None):
+        """Sorts and indexes the loaded objects. box: bounding box read from the file, if valid"""
+        # display the more important nodes on top, sorting once instead of after every node like Manager.new_node
+        self.document.sort_nodes()
+        if self.success:
+            self.search = Search.build(self.nodes.values())
+            self.link_index = LinkIndex.build(self.links.values())
+            if box is not None and len(self.nodes): self.bounds = box, None
+            else: self.bounds = Bounds.build(self.nodes.values())
+        self.progress = 1
+
+class Chunks:
+    """Static class, handles the chunked save files, for graphs too big to be loaded at once.
+    Their zip file contains an index, chunks.txt (camera, images, list of chunks and first unused IDs),
+    and one chunks/<x>_<y>.txt file per square cell of SIZE graph units, with the nodes in that cell.
+    Chunks use the same commands as save.txt, a link being written into the chunks of both its nodes:
+    it is created once both are loaded.
+
+    Only the chunks around the viewport are loaded, the far ones being unloaded unless they changed
+    since the last save. Saving rewrites the changed chunks and copies the other ones from the previous file.
+    Search, minimap, exports, automatic layout and availability only take the loaded nodes into account."""
+
+    SIZE = 20 # width and height of the cells, in graph units
+    LOAD_MARGIN = 1 # cells loaded around the viewport
+    UNLOAD_MARGIN = 3 # unchanged cells further than this from the viewport are unloaded
+    MAX_LOADED = 256 # when zoomed out, only the cells closest to the center of the screen are loaded
+    LOADS_PER_FRAME = 4
+
+    file = None # chunked save file, None if the graph is not chunked
+    cells = set() # cells having a chunk in the file, (x, y) tuples
+    loaded = {} # key: loaded cell, value: set of IDs of the nodes stored in its chunk
+    node_cells = {} # key: loaded node ID, value: cell it is stored in
+    link_cells = {} # key: loaded link ID, value: cells of the chunks it is stored in
+    next_ids = {} # key: Node or Link, value: first ID not used in the file
+    view = None # visible cells during the last update, (x0, y0, x1, y1)
+    queue = [] # cells to load, closest first
+
+    DOCUMENT_STATE = ('file', 'cells', 'loaded', 'node_cells', 'link_cells', 'next_ids', 'view', 'queue')
+
+    @staticmethod
+    def reset(file=None, cells=None, next_ids=None):
+        Chunks.file = file
+        Chunks.cells = set() if cells is None else cells
+        Chunks.loaded = {}
+        Chunks.node_cells = {}
+        Chunks.link_cells = {}
+        Chunks.next_ids = {Node: 0, Link: 0} if next_ids is None else next_ids
+        Chunks.view = None
+        Chunks.queue = []
+
+    @staticmethod
+    def is_chunked(file):
+        try:
+            with ZipFile(file) as z:
+                return 'chunks.txt' in z.namelist()
+        except Exception:
+            return False # let the usual loading report the error
+
+    @staticmethod
+    def cell(x, y):
+        return floor(x/Chunks.SIZE), floor(y/Chunks.SIZE)
+
+    @staticmethod
+    def open(file):
+        """Reads the index of a chunked save file and loads its images into a new document, no chunk is loaded yet.
+        Like with Loader, nothing is changed until the document is swapped in by Graph.open_chunked.
+        Returns (document, cells, next_ids, scroll, zoom), scroll and zoom being None if not in the file.
+        Raises an exception if the file is invalid."""
+        document = Document()
+        cells = set()
+        next_ids = {Node: 0, Link: 0}
+        scroll = zoom = None
+        try:
+            with ZipFile(file) as z:
+                for raw in z.read('chunks.txt').decode().split('\n'):
+                    args = raw.split(' ')
+                    match args[0]:
+                        case 'C': cells.add((int(args[1]), int(args[2])))
+                        case 'I': document.images[int(args[2])] = Image(args[1], z.read(args[1]), document, int(args[2]))
+                        case '_N': next_ids = {Node: int(args[1]), Link: int(args[2])}
+                        case '_S': scroll = float(args[1]), float(args[2])
+                        case '_Z': zoom = float(args[1]) or 1
+                        case '' | '#': pass
+                        case _: raise ValueError('unknown command in chunks.txt: '+raw)
+
+                # the chunks are read when needed, check that they all exist now, as saving copies them
+                names = set(z.namelist())
+                for cell in cells:
+                    if 'chunks/%d_%d.txt' %cell not in names: raise ValueError('missing chunk: %d %d' %cell)
+        except Exception:
+            document.close()
+            raise
+        return document, cells, next_ids, scroll, zoom
+
+    @staticmethod
+    def load(cell, z):
+        """Loads the chunk of a cell from the opened zip file z.
+        Creates its nodes, and the links whose nodes are both loaded. Nodes should be sorted afterwards."""
+        ids = Chunks.loaded[cell] = set()
+        if cell not in Chunks.cells: return
+        name = 'chunks/%d_%d.txt' %cell
+
+        links = []
+        for y, raw in enumerate(z.read(name).decode().split('\n')):
+            args = raw.split(' ')
+            try:
+                match args[0]:
+                    case 'P':
+                        x, _y, rank, state, id = args[1:]
+                        id = int(id)
+                        Manager.nodes[id] = Node(float(x), float(_y), int(rank), int(state), id)
+                        ids.add(id)
+                        Chunks.node_cells[id] = cell
+                    case 'L': links.append((int(args[1]), int(args[2]), int(args[3])))
+                    case 'Ai': Manager.nodes[int(args[1])].set_image(Manager.images[int(args[2])])
+                    case 'At': Manager.nodes[int(args[1])].set_text(args[2].replace('\0', ' ').strip())
+                    case '' | '#': pass
+                    case _: raise ValueError
+            except (ValueError, KeyError, IndexError):
+                Error.syntax(y, raw, name)
+                break
+
+        nodes = Manager.nodes
+        for n1, n2, id in links:
+            if id not in Manager.links and n1 in nodes and n2 in nodes:
+                Manager.links[id] = Link(nodes[n1], nodes[n2], id)
+                Chunks.link_cells[id] = (Chunks.node_cells.get(n1), Chunks.node_cells.get(n2))
+
+    @staticmethod
+    def unload(cell):
+        for id in Chunks.loaded.pop(cell):
+            node = Manager.nodes.get(id)
+            if node is None: continue
+            for link in node.links:
+                Chunks.link_cells.pop(link.id, None)
+            Manager.delete_node(id)
+            del Chunks.node_cells[id]
+
+    @staticmethod
+    def modified():
+        """Returns the cells whose chunk changed since the last save, according to Journal"""
+        cells = set()
+        for id in Journal.nodes | Journal.removed_nodes:
+            if id in Chunks.node_cells: cells.add(Chunks.node_cells[id])
+            if id in Manager.nodes: cells.add(Chunks.cell(Manager.nodes[id].x, Manager.nodes[id].y))
+        for id in Journal.links | Journal.removed_links:
+            cells.update(Chunks.link_cells.get(id, ()))
+            link = Manager.links.get(id)
+            if link is not None and link.n2 is not None:
+                for node in (link.n1, link.n2):
+                    cells.add(Chunks.node_cells.get(node.id))
+                    cells.add(Chunks.cell(node.x, node.y))
+        cells.discard(None)
+        return cells
+
+    @staticmethod
+    def update():
+        """Loads the chunks around the viewport, a few per frame, and unloads the far ones. Called every frame."""
+        x0, y0 = Chunks.cell(*graph.screen2coord(0, 0))
+        x1, y1 = Chunks.cell(*graph.screen2coord(Graph.W, Graph.H))
+
+        if (x0, y0, x1, y1) != Chunks.view:
+            Chunks.view = x0, y0, x1, y1
+            m = Chunks.LOAD_MARGIN
+            cx, cy = (x0+x1)/2, (y0+y1)/2
+            if (x1-x0+1+m*2) * (y1-y0+1+m*2) < len(Chunks.cells):
+                cells = [(x, y) for x in range(x0-m, x1+m+1) for y in range(y0-m, y1+m+1) if (x, y) in Chunks.cells]
+            else:
+                cells = [(x, y) for x, y in Chunks.cells if x0-m <= x <= x1+m and y0-m <= y <= y1+m]
+            wanted = sorted(cells, key=lambda cell: (cell[0]-cx)**2 + (cell[1]-cy)**2)[:Chunks.MAX_LOADED]
+            Chunks.queue = [cell for cell in wanted if cell not in Chunks.loaded]
+
+            # unload the far cells, and the ones left out by the limit, unless they are needed
+            cells, wanted = set(cells), set(wanted)
+            m = Chunks.UNLOAD_MARGIN
+            keep = Chunks.modified()
+            for obj in graph.selection + ([] if graph.link is None else [graph.link]):
+                for node in (obj,) if type(obj) == Node else (obj.n1, obj.n2):
+                    if node is not None: keep.add(Chunks.node_cells.get(node.id))
+
+            unload = [cell for cell in Chunks.loaded if cell not in keep and cell not in wanted and
+                      (cell in cells or not (x0-m <= cell[0] <= x1+m and y0-m <= cell[1] <= y1+m))]
+            if len(unload):
+                Journal.recording = False
+                for cell in unload: Chunks.unload(cell)
+                Journal.recording = True
+                graph.minimap.full = True
+                LinkIndex.dirty = True
+                Bounds.reset()
+
+        if len(Chunks.queue): Chunks.load_cells(Chunks.queue[:Chunks.LOADS_PER_FRAME])
+
+    @staticmethod
+    def load_cells(cells):
+        """Loads the chunks of cells from the file, without recording them as changes, and updates what depends on the nodes"""
+        Journal.recording = False
+        with ZipFile(Chunks.file) as z:
+            for cell in cells:
+                Chunks.load(cell, z)
+        Journal.recording = True
+        Chunks.queue = [cell for cell in Chunks.queue if cell not in Chunks.loaded]
+
+        Manager.document.sort_nodes()
+        graph.minimap.full = True
+        LinkIndex.dirty = True
+        Bounds.reset()
+
+    @staticmethod
+    def save(file, scroll, zoom):
+        """Writes a chunked save file. If the graph was already chunked, only the changed chunks are written,
+        the other ones are copied from the previous file, otherwise the whole graph is written."""
+        old = Chunks.file
+        if old is None:
+            Chunks.reset()
+            dirty = {Chunks.cell(node.x, node.y) for node in Manager.nodes.values()}
+        else:
+            dirty = Chunks.modified()
+            # cells receiving moved nodes need to be loaded to be rewritten
+            cells = [cell for cell in dirty if cell in Chunks.cells and cell not in Chunks.loaded]
+            if len(cells): Chunks.load_cells(cells)
+
+        # nodes and links of the rewritten chunks
+        chunks = {cell: ([], {}) for cell in dirty}
+        for node in Manager.nodes.values():
+            cell = Chunks.cell(node.x, node.y)
+            if cell not in chunks: continue
+            nodes, links = chunks[cell]
+            nodes.append(node)
+            for link in node.links:
+                if link.n2 is not None: links[link.id] = 'L %d %d %d' %(link.n1.id, link.n2.id, link.id)
+
+        z_old = None if old is None else ZipFile(old)
+
+        # keep the links to the nodes that are not loaded, in the chunks where their loaded node now is
+        if z_old is not None:
+            for cell in dirty & Chunks.cells:
+                for raw in z_old.read('chunks/%d_%d.txt' %cell).decode().split('\n'):
+                    args = raw.split(' ')
+                    if args[0] != 'L': continue
+                    n1, n2, id = int(args[1]), int(args[2]), int(args[3])
+                    if id in Manager.links or id in Journal.removed_links or \
+                       n1 in Journal.removed_nodes or n2 in Journal.removed_nodes: continue
+                    for node in (Manager.nodes.get(n1), Manager.nodes.get(n2)):
+                        if node is None: continue
+                        cell = Chunks.cell(node.x, node.y)
+                        if cell in chunks: chunks[cell][1][id] = raw
+
+        tmp = file+'.tmp'
+        with ZipFile(tmp, 'w') as z:
+            for cell in sorted(Chunks.cells | dirty):
+                name = 'chunks/%d_%d.txt' %cell
+                if cell not in dirty:
+                    z.writestr(name, z_old.read(name))
+                    continue
+
+                nodes, links = chunks[cell]
+                if not len(nodes):
+                    Chunks.cells.discard(cell)
+                    continue
+                Chunks.cells.add(cell)
+                Chunks.loaded[cell] = set()
+
+                content = []
+                for node in nodes:
+                    content.append('P %f %f %d %d %d' %(node.x, node.y, node.rank, node.state, node.id))
+                    Chunks.loaded[cell].add(node.id)
+                    Chunks.node_cells[node.id] = cell
+                content += links.values()
+                for node in nodes:
+                    if node.image is not None: content.append('Ai %d %d' %(node.id, node.image.id))
+                    if node.text: content.append('At %d %s' %(node.id, node.text.replace(' ', '\0')))
+                z.writestr(name, '\n'.join(content)+'\n')
+
+            # the images used by the chunks that are not loaded are not known: keep them all
+            for image in Manager.images.values():
+                z.writestr(image.path, image.encode())
+
+            Chunks.next_ids = {Node: max(Chunks.next_ids[Node], max(Manager.nodes, default=-1)+1),
+                               Link: max(Chunks.next_ids[Link], max(Manager.links, default=-1)+1)}
+            index = ['_S %f %f' %scroll, '_Z %f' %zoom, '_N %d %d' %(Chunks.next_ids[Node], Chunks.next_ids[Link])]
+            index += ['I %s %d' %(image.path, image.id) for image in Manager.images.values()]
+            index += ['C %d %d' %cell for cell in sorted(Chunks.cells)]
+            z.writestr('chunks.txt', '\n'.join(index)+'\n')
+
+        if z_old is not None: z_old.close()
+        os.replace(tmp, file)
+
+        # the moved nodes are now stored in their new cell
+        for cell in dirty:
+            for id in list(Chunks.loaded.get(cell, ())):
+                if Chunks.node_cells.get(id) != cell or id not in Manager.nodes:
+                    Chunks.loaded[cell].discard(id)
+                    if id not in Manager.nodes: Chunks.node_cells.pop(id, None)
+        for link in Manager.links.values():
+            if link.n2 is not None: Chunks.link_cells[link.id] = (Chunks.node_cells[link.n1.id], Chunks.node_cells[link.n2.id])
+
+        Chunks.file = file
+        Chunks.view = None
+
+class Importer:
+    """Creates the objects read from a file in another format into a Loader, see Formats.
+    The nodes can have any IDs in the file, they are numbered in the order they are read.
+    Links can come before their nodes, they are then created once the whole file was read.
+    Like in the editor, links from a node to itself and several links between the same nodes are skipped."""
+
+    GRID = 100 # nodes without a position are placed on a grid, with this many nodes per row
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.ids = {} # key: node ID in the file, value: node ID
+        self.pending = [] # (source, target) links whose nodes were not read yet
+        self.linked = set() # (node ID, node ID) pairs of the linked nodes, smallest ID first
+        self.loops = 0 # number of links from a node to itself skipped
+        self.duplicates = 0 # number of links between already linked nodes skipped
+
+    def node(self, id, x=None, y=None, rank=0, state=0, text=''):
+        if id in self.ids: raise ValueError('duplicate node ID: %s' %id)
+        n = self.ids[id] = len(self.ids)
+        if x is None or y is None: x, y = n % Importer.GRID * 1.5, n // Importer.GRID * 2
+        self.loader.set_node(x, y, min(max(int(rank), 0), Node.N_RANKS-1), min(max(int(state), 0), 2), n)
+
+        # the text is written on a single line in save files
+        text = ' '.join(str(text).split())
+        if text: self.loader.nodes[n].set_text(text)
+
+    def link(self, source, target):
+        if source not in self.ids or target not in self.ids:
+            self.pending.append((source, target))
+            return
+
+        n1, n2 = self.ids[source], self.ids[target]
+        pair = (min(n1, n2), max(n1, n2))
+        if n1 == n2: self.loops += 1
+        elif pair in self.linked: self.duplicates += 1
+        else:
+            self.linked.add(pair)
+            self.loader.new_link(n1, n2, len(self.loader.links))
+
+    def finish(self):
+        """Creates the links read before their nodes, reports the skipped links"""
+        missing = 0
+        for source, target in self.pending:
+            if source in self.ids and target in self.ids: self.link(source, target)
+            else: missing += 1
+
+        skipped = []
+        if missing: skipped.append('%d link(s) to unknown nodes' %missing)
+        if self.loops: skipped.append('%d link(s) from a node to itself' %self.loops)
+        if self.duplicates: skipped.append('%d duplicate link(s)' %self.duplicates)
+        if len(skipped):
+            self.loader.error(Error.corrupted_file, ', '.join(skipped) + ' were skipped', True)
+
+class Formats:
+    """Static class, file formats the graphs can be imported from (with O) and exported to (with X),
+    to exchange them with other tools. A format is a class with:
+    - NAME and EXTENSIONS, used by the file dialogs and to find the format of a file
+    - read(f, importer): generator reading the binary file f, passing the objects to the Importer
+      and yielding after each one, so that the Loader can update the progress and stop if cancelled
+    - lines(): generator of the lines of the exported file
+    Files are read and written as streams, so big files don't need to fit in memory as text.
+    Images are not exported, and imported files are opened without a save file: saving asks for a new one."""
+
+    formats = []
+
+    @staticmethod
+    def register(format):
+        Formats.formats.append(format)
+
+    @staticmethod
+    def get(file):
+        """Returns the format of a file according to its extension, None for save files"""
+        ext = splitext(file)[1].lower()
+        for format in Formats.formats:
+            if ext in format.EXTENSIONS: return format
+
+    @staticmethod
+    def filetypes():
+        return tuple((format.NAME, format.EXTENSIONS) for format in Formats.formats)
+
+    @staticmethod
+    def export(file, format):
+        with open(file, 'wb') as f:
+            Graph.write_blocks(f, format.lines())
+
+class NDJSON:
+    """One JSON object per line: {"type": "node", "id": 0, "x": 1.5, "y": -2, "rank": 0, "state": 1, "text": "..."}
+    for nodes, only type and id being required, and {"type": "link", "source": 0, "target": 1} for links"""
+
+    NAME = 'Newline-delimited JSON'
+    EXTENSIONS = ('.ndjson', '.jsonl')
+
+    @staticmethod
+    def read(f, importer):
+        for y, line in enumerate(f):
+            if not line.strip(): continue
+            obj = loads(line)
+            match obj.get('type'):
+                case 'node': importer.node(obj['id'], obj.get('x'), obj.get('y'), obj.get('rank', 0),
+                                           obj.get('state', 0), obj.get('text', ''))
+                case 'link': importer.link(obj['source'], obj['target'])
+                case _: raise ValueError('unknown object type at line %d' %(y+1))
+            yield
+
+    @staticmethod
+    def lines():
+        for id, node in Manager.nodes.items():
+            obj = {'type': 'node', 'id': id, 'x': node.x, 'y': node.y, 'rank': node.rank, 'state': node.state}
+            if node.text: obj['text'] = node.text
+            yield dumps(obj)+'\n'
+        for link in Manager.links.values():
+            if link.n2 is not None:
+                yield '{"type": "link", "source": %d, "target": %d}\n' %(link.n1.id, link.n2.id)
 
-        # get color depending on if the link is hovered/selected
-        i = 2 if self in graph.selection else 1 if self == graph.hovered else 0
-        col = Palette.link[self.state][i]
-        col2 = Palette.link2[self.state][i]
+class GraphML:
+    """GraphML, the nodes having x, y, rank, state and text data (label is also read as text), edges being links.
+    Keys are matched by their attr.name, nodes without position are placed on a grid, see Importer."""
 
-        # get the actually displayed size and decide if need to draw a center line
-        s = self.size if graph.zoom > 1 else self.size*graph.zoom
+    NAME = 'GraphML'
+    EXTENSIONS = ('.graphml',)
 
-        pygame.draw.line(surf, col, pos1, pos2, 1 if s < 1 else int(s))
-        if s >= 3: pygame.draw.line(surf, col2, pos1, pos2, int(s/3))
+    KEYS = (('x', 'double'), ('y', 'double'), ('rank', 'int'), ('state', 'int'), ('text', 'string'))
+    TYPES = {'x': float, 'y': float, 'rank': int, 'state': int, 'text': str, 'label': str}
 
-class Image:
-    """Pygame surface loaded from image file.
-    The stored path is cut to the base name, to then be cached in the save zip file."""
+    @staticmethod
+    def read(f, importer):
+        from xml.etree.ElementTree import iterparse
+        keys = {} # key: key ID, value: attribute name
+        parents = [] # open elements, to remove the elements once read
+        for event, elem in iterparse(f, ('start', 'end')):
+            tag = elem.tag.rsplit('}', 1)[-1] # without namespace
+            if event == 'start':
+                parents.append(elem)
+                continue
+            parents.pop()
+
+            if tag == 'key' and elem.get('for', 'node') in ('node', 'all'):
+                keys[elem.get('id')] = elem.get('attr.name', elem.get('id'))
+            elif tag == 'node':
+                data = {}
+                for child in elem:
+                    name = keys.get(child.get('key'))
+                    if child.tag.rsplit('}', 1)[-1] == 'data' and name in GraphML.TYPES and child.text is not None:
+                        data[name] = GraphML.TYPES[name](child.text.strip())
+                importer.node(elem.get('id'), data.get('x'), data.get('y'), data.get('rank', 0),
+                              data.get('state', 0), data.get('text', data.get('label', '')))
+            elif tag == 'edge': importer.link(elem.get('source'), elem.get('target'))
+            else: continue
+
+            # forget the element, so that the tree doesn't grow with the file
+            elem.clear()
+            if len(parents): parents[-1].remove(elem)
+            yield
 
-    def __init__(self, path, content, id):
-        """Loads an image from the save zip file (content is a bytes array)
-        or from the disk (content is None, and path is used to load the image)"""
+    @staticmethod
+    def lines():
+        from xml.sax.saxutils import escape
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+        for name, type in GraphML.KEYS:
+            yield '<key id="%s" for="node" attr.name="%s" attr.type="%s"/>\n' %(name, name, type)
+        yield '<graph edgedefault="directed">\n'
 
-        self.path = basename(path).replace(' ', '_')
-        self.name = splitext(self.path)[0]
-        if content is None:
-            # load image from disk
-            self.surf = pygame.image.load(path).convert_alpha()
-        else:
-            # get the width, height, and image data from content
-            i = content.index(b'.')
-            w = int(content[:i].decode())
-            content = content[i+1:]
-            i = content.index(b'.')
-            h = int(content[:i].decode())
-            content = content[i+1:]
-            self.surf = pygame.image.frombytes(content, (w, h), 'RGBA')
-        self.id = id
+        for id, node in Manager.nodes.items():
+            text = '<data key="text">%s</data>' %escape(node.text) if node.text else ''
+            yield '<node id="n%d"><data key="x">%r</data><data key="y">%r</data><data key="rank">%d</data>' \
+                  '<data key="state">%d</data>%s</node>\n' %(id, node.x, node.y, node.rank, node.state, text)
+        for id, link in Manager.links.items():
+            if link.n2 is not None:
+                yield '<edge id="e%d" source="n%d" target="n%d"/>\n' %(id, link.n1.id, link.n2.id)
+        yield '</graph>\n</graphml>\n'
+
+Formats.register(NDJSON)
+Formats.register(GraphML)
 
 class UI:
     """UI elements on top of the screen: help, info about selection"""
@@ -748,15 +2397,15 @@ class UI:
         self.surf = None # blitted, cached surface
         self.zoom_surf = None
 
-        self.raw_texts = [('Left click: select elements, drag with mouse: move object/camera, mouse scroll: zoom in/out, S: save file, W: save as file, N: new file, O: open file, P: new node, I: import image to the images bank, E: export graph to image (no background), F: export with background'),
+        self.raw_texts = [('Left click: select elements, drag with mouse: move object/camera, mouse scroll: zoom in/out, S: save file, W: save as file (Shift+W: as a chunked file), N: new file, O: open file, B: browse the files of a directory, P: new node, I: import images to the images bank (Shift+I: a whole directory), E: export graph to image (no background), F: export with background, V: export to svg, D: export to zoomable tiles, X: export to JSON or GraphML, G: automatic layout (Shift+G: layered, G again: stop, Escape: cancel), U: show available nodes, M: minimap'),
                           'Del: delete link']
         # edit texts to discriminate between deleting a node, its image or its text
-        text = 'L: start link, I: attach image from the bank, T: add text, R: cycle rank, S: cycle state, Del: delete %s'
+        text = 'L: start link, I: attach image from the bank, T: add text, R: cycle rank, S: cycle state, Del: delete %s (I, T, R, S and Del apply to all the selected nodes)'
         self.raw_texts.append(text %'node')
         self.raw_texts.append(text %"the node's text")
         self.raw_texts.append(text %"the node's image")
         for i in range(len(self.raw_texts)):
-            self.raw_texts[i] += ', Z: reset zoom, A: reset camera pos+zoom, Q: quit'
+            self.raw_texts[i] += ', Z: reset zoom, A: reset camera pos+zoom (Shift+A: fit the whole graph), Ctrl+F: search, Ctrl+O/Ctrl+N/Ctrl+W: open/new/close file in another tab, Ctrl+Tab: next tab, F3: performance overlay, Q: quit'
 
         self.process_raw_texts()
 
@@ -764,10 +2413,16 @@ class UI:
         self.last_zoom = 0
 
     def process_raw_texts(self):
-        """Makes text surfaces out of self.raw_texts"""
-
+        """Forgets the text surfaces made out of self.raw_texts, on init and when the window is resized.
+        Each one is made when first displayed, see get_text"""
         self.text = [None]*len(self.raw_texts)
-        for i, text in enumerate(self.raw_texts):
+        self.update_surf(True)
+
+    def get_text(self, i):
+        """Returns the surface of self.raw_texts[i], word wrapped to the window width"""
+        if self.text[i] is None:
+            text = self.raw_texts[i]
+
             # word wrap
             lines = ['']
             j = 0
@@ -791,19 +2446,18 @@ class UI:
                 surf.blit(font.render(line, True, Palette.text), (0, y))
                 y += 16
             self.text[i] = surf
-
-        self.update_surf(True)
+        return self.text[i]
 
     def update_surf(self, init=False):
         """Updates cached Surface: redraws background, adds elements depending on selection.
         If init is True (should be set to True only on init), graph is assumed to not exist (same as when graph.selection is None)."""
 
         if init or not len(graph.selection):
-            text = self.text[0]
+            text = self.get_text(0)
         elif type(graph.selection[0]) == Link:
-            text = self.text[1]
+            text = self.get_text(1)
         elif type(graph.selection[0]) == Node:
-            text = self.text[4 if graph.selection[0].image is not None else 3 if graph.selection[0].text else 2]
+            text = self.get_text(4 if graph.selection[0].image is not None else 3 if graph.selection[0].text else 2)
 
         h = 24 + text.get_height()
         self.surf = pygame.Surface((Graph.W, h), SRCALPHA)
@@ -831,7 +2485,7 @@ class UI:
         Param zoom: boolean, True if changed zoom this frame"""
 
         height = self.surf.get_height()
-        self.surf.set_alpha(100 if pygame.mouse.get_pos()[1] < height and pygame.mouse.get_focused() else 255)
+        self.surf.set_alpha(100 if Input.pos[1] < height and Input.focused else 255)
         screen.blit(self.surf, (0, 0))
 
         if zoom: self.last_zoom = ticks()
@@ -846,12 +2500,680 @@ class UI:
             self.zoom_surf.set_alpha(255 if dt < 2000 else (3000-dt)*0.255)
             screen.blit(self.zoom_surf, (Graph.W-w-10, height+12))
 
+class Layout:
+    """Automatic placement of the nodes, a few iterations being run each frame by Graph.update.
+    Linked nodes attract each other and all nodes repel each other, bigger (higher rank) nodes repelling more.
+    The repulsion is approximated Barnes-Hut style: for each level of a grid pyramid, the cells that are far enough
+    from a node act as a single mass, only the nodes in the neighboring cells of the finest grid are computed exactly.
+
+    In layered mode, better suited for progression trees, the nodes are placed on rows according to their depth
+    in the graph (links going from their first to their second node), and the forces only move them horizontally.
+
+    Requires numpy, imported when creating a layout."""
+
+    K = 1 # ideal distance between nodes, in graph units
+    ROW = 1.5 # distance between rows in layered mode
+    MAX_ITERATIONS = 300
+    BUDGET = 0.012 # time spent each frame, in seconds
+    OUTLIERS = 0.005 # fraction of the nodes on each side left out of the grid, clamped into its edge cells
+    MAX_EXACT = 32 # neighboring cells with more nodes act as a single mass, bounding the exact pairs
+
+    def __init__(self, nodes, links, layered=False):
+        import numpy as np
+
+        self.nodes = list(nodes)
+        self.layered = layered
+        self.start = [(node.x, node.y) for node in self.nodes] # to restore when cancelled
+
+        index = {node: i for i, node in enumerate(self.nodes)}
+        self.edges = np.array([(index[link.n1], index[link.n2]) for link in links if link.n2 is not None], dtype=np.int64).reshape(-1, 2)
+        self.w = np.array([node.size for node in self.nodes], dtype=float) / Node.rank_sizes[0]
+        self.pos = np.array(self.start, dtype=float).reshape(-1, 2)
+
+        # nodes at the same position (e.g. created at the same place) would have no repulsion direction
+        self.pos += np.random.default_rng(0).uniform(-0.01, 0.01, self.pos.shape)
+
+        if layered: self.pos[:, 1] = self.pos[:, 1].min() + self.layers()*Layout.ROW
+
+        # for each position of a cell in its parent cell, offsets from the parent's first child of the cells far enough
+        # to be approximated: children of the parent's neighbors, that are not neighbors of the cell itself
+        self.offsets = np.array([[(ox, oy) for ox in range(-2, 4) for oy in range(-2, 4) if abs(ox-px) > 1 or abs(oy-py) > 1]
+                                 for px in (0, 1) for py in (0, 1)], dtype=np.int32)
+
+        span = (self.pos.max(0) - self.pos.min(0)).max() if len(self.nodes) else 0
+        self.temperature = max(span/10, Layout.K) # maximum displacement of a node in one iteration
+        self.iteration = 0
+
+    def layers(self):
+        """Returns the depth of every node, the longest path to it following the links.
+        Nodes in cycles get arbitrary depths."""
+        import numpy as np
+
+        # Kahn's algorithm: a node is placed once all the nodes linked to it are
+        n = len(self.nodes)
+        layer = [0]*n
+        next_nodes = [[] for _ in range(n)]
+        incoming = [0]*n
+        for a, b in self.edges.tolist():
+            next_nodes[a].append(b)
+            incoming[b] += 1
+
+        queue = deque(i for i in range(n) if not incoming[i])
+        placed = [False]*n
+        unplaced = 0 # first node that may not be placed yet
+        while True:
+            if not len(queue):
+                # only cycles are left: place one of their nodes, ignoring its remaining incoming links
+                while unplaced < n and placed[unplaced]: unplaced += 1
+                if unplaced == n: break
+                incoming[unplaced] = 0
+                queue.append(unplaced)
+
+            i = queue.popleft()
+            if placed[i]: continue
+            placed[i] = True
+            for j in next_nodes[i]:
+                if placed[j]: continue
+                layer[j] = max(layer[j], layer[i]+1)
+                incoming[j] -= 1
+                if not incoming[j]: queue.append(j)
+
+        # remove the gaps left by cycles
+        return np.unique(layer, return_inverse=True)[1].reshape(-1)
+
+    def repulsion(self):
+        import numpy as np
+
+        P, w = self.pos, self.w
+        N = len(P)
+        k2 = Layout.K*Layout.K
+
+        # positions as complex numbers: the force d/|d|^2 is then 1/conj(d)
+        z = P[:, 0] + 1j*P[:, 1]
+        z32 = z.astype(np.complex64) # single precision is enough for the far cells, and faster
+        F = np.zeros(N, dtype=complex)
+
+        # the grid covers the occupied area: a few far away nodes would otherwise crowd all the others into one cell
+        lo, hi = np.quantile(P, (Layout.OUTLIERS, 1-Layout.OUTLIERS), 0)
+        span = (hi - lo).max() or 1
+        U = np.clip((P - lo) / span, 0, 0.999999) # in [0, 1[
+        # the cells act as masses at the clamped positions, the far away nodes would drag them out of the grid
+        Q = lo + U*span
+        zq = Q[:, 0] + 1j*Q[:, 1]
+
+        # the finest grid holds around 4 nodes per cell
+        levels = max(2, int(np.ceil(np.log2(np.sqrt(N/4)))))
+        for level in range(2, levels+1):
+            n = 1 << level
+            c = (U*n).astype(np.int32)
+            cx, cy = c[:, 0], c[:, 1]
+            cell = cx*n + cy
+
+            cell_mass = np.bincount(cell, w, n*n)
+            moment = np.bincount(cell, w*zq.real, n*n) + 1j*np.bincount(cell, w*zq.imag, n*n)
+            mass = cell_mass.astype(np.float32)
+            com = (moment / np.maximum(cell_mass, 1e-12)).astype(np.complex64)
+
+            # far cells at this level, acting as a single mass at their center of mass
+            offsets = self.offsets[(cx & 1)*2 + (cy & 1)]
+            tx = (cx & ~1)[:, None] + offsets[..., 0]
+            ty = (cy & ~1)[:, None] + offsets[..., 1]
+            valid = (tx >= 0) & (tx < n) & (ty >= 0) & (ty < n)
+            tc = np.where(valid, tx*n + ty, 0)
+
+            d = np.where(valid, z32[:, None] - com[tc], 1)
+            F += (np.where(valid, mass[tc], 0) / np.conj(d)).sum(1)
+
+        # exact repulsion from the nodes in the neighboring cells of the finest grid
+        order = np.argsort(cell, kind='stable')
+        starts = np.searchsorted(cell[order], np.arange(n*n+1))
+        I, J, S = [], [], []
+        for ox in (-1, 0, 1):
+            for oy in (-1, 0, 1):
+                tx, ty = cx+ox, cy+oy
+                i = np.nonzero((tx >= 0) & (tx < n) & (ty >= 0) & (ty < n))[0]
+                tcell = tx[i]*n + ty[i]
+                first, count = starts[tcell], starts[tcell+1] - starts[tcell]
+
+                # only MAX_EXACT nodes of the crowded cells are used, their repulsion scaled to the whole cell
+                sample = np.minimum(count, Layout.MAX_EXACT)
+                S.append(np.repeat(count / np.maximum(sample, 1), sample))
+                count = sample
+
+                # pairs (node, every node in the neighboring cell)
+                I.append(np.repeat(i, count))
+                J.append(order[np.repeat(first, count) + np.arange(count.sum()) - np.repeat(np.cumsum(count)-count, count)])
+        I, J, S = np.concatenate(I), np.concatenate(J), np.concatenate(S)
+        keep = I != J
+        I, J, S = I[keep], J[keep], S[keep]
+
+        f = S*w[J] / (np.conj(z[I] - z[J]) + 1e-9)
+        F += np.bincount(I, f.real, N) + 1j*np.bincount(I, f.imag, N)
+
+        F *= k2*w
+        return np.stack((F.real, F.imag), 1)
+
+    def step(self):
+        """Runs one iteration, returns False once the layout is done"""
+        import numpy as np
+
+        P = self.pos
+        F = self.repulsion()
+
+        # attraction between linked nodes
+        a, b = self.edges.T
+        d = P[b] - P[a]
+        f = d * (np.sqrt((d*d).sum(1)) / Layout.K)[:, None]
+        for axis in (0, 1):
+            F[:, axis] += np.bincount(a, f[:, axis], len(P)) - np.bincount(b, f[:, axis], len(P))
+
+        # weak gravity, keeps the unconnected parts together
+        F -= 0.02 * self.w[:, None] * (P - P.mean(0))
+
+        if self.layered: F[:, 1] = 0
+
+        # move the nodes, no more than self.temperature
+        length = np.sqrt((F*F).sum(1)) + 1e-9
+        P += F * (np.minimum(length, self.temperature) / length)[:, None]
+
+        self.temperature *= 0.97
+        self.iteration += 1
+        return self.iteration < Layout.MAX_ITERATIONS and self.temperature > Layout.K*0.01
+
+    def update(self):
+        """Runs iterations for at most Layout.BUDGET seconds and moves the nodes.
+        Returns False once the layout is done."""
+        if len(self.nodes) < 2: return False
+
+        end = perf_counter() + Layout.BUDGET
+        running = True
+        while running and perf_counter() < end:
+            running = self.step()
+
+        for node, (x, y) in zip(self.nodes, self.pos.tolist()):
+            node.x, node.y = x, y
+        LinkIndex.dirty = True
+        Bounds.reset()
+        return running
+
+    def restore(self):
+        """Moves the nodes back to where they were before the layout"""
+        for node, (x, y) in zip(self.nodes, self.start):
+            node.x, node.y = x, y
+        LinkIndex.dirty = True
+        Bounds.reset()
+
+class Profiler:
+    """Measures frame times and the time spent in each part of a frame, displayed in an overlay toggled with F3.
+    While the overlay is displayed, F4 dumps the recorded frames into a JSON file,
+    F5 starts or stops a cProfile capture, dumped into a .prof file when stopped,
+    and F6 starts or stops recording the input (see Input)."""
+
+    HISTORY = 240 # number of recorded frames
+    SUBSYSTEMS = ('layout', 'chunks', 'culling', 'hover', 'events', 'links', 'nodes', 'ui', 'flip')
+
+    def __init__(self):
+        self.enabled = False
+
+        self.frames = deque(maxlen=Profiler.HISTORY) # (frame time, {subsystem: time}, {counter: value}), in ms
+        self.timings = {} # timings of the current frame
+        self.counts = {} # counters of the current frame, e.g. visible nodes
+        self.hits = self.misses = 0 # cached node surfaces, for the current frame
+        self.frame_start = perf_counter()
+
+        self.profile = None # cProfile.Profile object while capturing
+
+    def toggle(self):
+        self.enabled = not self.enabled
+
+    def lap(self, name, start):
+        """Adds the time since start to a subsystem, returns the current time to chain measurements"""
+        now = perf_counter()
+        self.timings[name] = self.timings.get(name, 0) + (now-start)*1000
+        return now
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def cache(self, hit):
+        if hit: self.hits += 1
+        else: self.misses += 1
+
+    def end_frame(self):
+        """Called by the main loop once per frame, records the current frame"""
+        now = perf_counter()
+        total = self.hits + self.misses
+        self.counts['node cache hits'] = self.hits/total if total else 1
+
+        self.frames.append(((now-self.frame_start)*1000, self.timings, self.counts))
+        self.timings = {}
+        self.counts = {}
+        self.hits = self.misses = 0
+        self.frame_start = now
+
+    def dump(self):
+        """Writes the recorded frames into a JSON file in the working directory"""
+        file = 'profile_%s.json' %strftime('%Y%m%d_%H%M%S')
+        with open(file, 'w') as f:
+            f.write(dumps([{'frame': frame, 'timings': timings, 'counts': counts}
+                           for frame, timings, counts in self.frames], indent=1))
+        print('Frame times written to', file)
+
+    def toggle_capture(self):
+        """Starts a cProfile capture, or stops it and writes its stats into a .prof file"""
+        if self.profile is None:
+            from cProfile import Profile
+
+            self.profile = Profile()
+            self.profile.enable()
+        else:
+            self.profile.disable()
+            file = 'profile_%s.prof' %strftime('%Y%m%d_%H%M%S')
+            self.profile.dump_stats(file)
+            self.profile = None
+            print('cProfile stats written to', file)
+
+    def draw(self, surf):
+        """Draws the overlay in the bottom left corner of surf"""
+        if not self.frames: return
+
+        frames = [frame for frame, _, _ in self.frames]
+        avg = sum(frames)/len(frames)
+        _, timings, counts = self.frames[-1]
+
+        lines = ['frame: %.2f ms avg, %.2f ms max (%d fps)' %(avg, max(frames), 1000/avg if avg else 0)]
+        for name in Profiler.SUBSYSTEMS:
+            # average over the last frames, smoother to read
+            t = sum(f[1].get(name, 0) for f in self.frames)/len(self.frames)
+            lines.append('%-8s %6.2f ms' %(name, t))
+        for name, value in counts.items():
+            lines.append('%s: %s' %(name, '%d%%' %(value*100) if type(value) == float else value))
+        if self.profile is not None: lines.append('cProfile capture running (F5 to stop)')
+        if Input.record_file is not None: lines.append('recording input (F6 to stop)')
+        lines.append('F4: dump frames, F5: cProfile capture, F6: record input')
+
+        # histogram of the frame times, the line marks 60 fps
+        hist_h = 60
+        w = max(Profiler.HISTORY, max(len(line) for line in lines)*char_w2) + 20
+        h = 20 + hist_h + 12*len(lines)
+        overlay = pygame.Surface((w, h), SRCALPHA)
+        overlay.fill((0, 0, 0, 180))
+
+        scale = hist_h/max(max(frames), 1000/30)
+        for x, frame in enumerate(frames):
+            bar_h = frame*scale
+            col = Palette.states[2] if frame < 1000/55 else Palette.states[1] if frame < 1000/30 else Palette.states[0]
+            pygame.draw.line(overlay, col, (10+x, 10+hist_h), (10+x, 10+hist_h-bar_h))
+        y = 10 + hist_h - 1000/60*scale
+        pygame.draw.line(overlay, Palette.text, (10, y), (10+Profiler.HISTORY, y))
+
+        for i, line in enumerate(lines):
+            overlay.blit(font2.render(line, True, Palette.text), (10, 15 + hist_h + 12*i))
+
+        surf.blit(overlay, (10, Graph.H - h - 10))
+
+class Minimap:
+    """Overview of the whole graph in a corner of the screen, with the viewport outlined. Clicking it moves the camera.
+    The graph is rendered once into a cached surface with the export projection, nodes as plain boxes.
+    Then, only the region around the objects that changed is redrawn, at most every UPDATE_DELAY ms.
+    Everything is redrawn when an object leaves the rendered area, or when a lot of objects changed."""
+
+    SIZE = 200 # max width and height in pixels
+    MARGIN = 0.1 # part of the graph size rendered around it, so that small moves don't need a full redraw
+    UPDATE_DELAY = 200
+    PREVIEW_OBJECTS = 20000 # max nodes and links drawn in the previews of the save files
+
+    def __init__(self):
+        self.enabled = False
+        self.surf = None
+        self.rect = Rect(0, 0, 0, 0) # position on the screen
+        self.dragging = False # moving the camera by dragging on the minimap
+
+        # rendered area, in graph coordinates, and scale in pixels per graph unit
+        self.x0 = self.y0 = 0
+        self.scale = 1
+
+        self.full = True # redraw everything on the next update
+        self.dirty = [] # regions of the surface to redraw
+        self.changed = set() # objects whose position on the surface needs to be computed again
+        self.last_update = 0
+
+        # regions of the surface the objects were drawn on, key: ID, value: Rect
+        self.nodes = {}
+        self.links = {}
+
+    def reset(self):
+        """Called when a file was opened, the minimap will be redrawn entirely"""
+        self.full = True
+        self.dirty = []
+        self.changed = set()
+        self.nodes = {}
+        self.links = {}
+
+    def changed_node(self, node):
+        """Called through Journal when a node is created or changed, or will be deleted"""
+        if not self.enabled or self.full:
+            self.full = True
+            return
+
+        if node.id in self.nodes: self.dirty.append(self.nodes[node.id])
+        self.changed.add(node)
+        for link in node.links:
+            self.changed_link(link)
+
+    def changed_link(self, link):
+        if not self.enabled or self.full:
+            self.full = True
+            return
+
+        if link.id in self.links: self.dirty.append(self.links[link.id])
+        self.changed.add(link)
+
+    def project(self, x, y):
+        return (x-self.x0)*self.scale, (y-self.y0)*self.scale
+
+    def node_rect(self, node):
+        x, y = self.project(node.x, node.y)
+        s = max(node.size/Graph.unit_size*self.scale, 2)
+        return Rect(x - s/2, y - s/2, s+1, s+1)
+
+    def link_rect(self, link):
+        (x1, y1), (x2, y2) = self.project(link.n1.x, link.n1.y), self.project(link.n2.x, link.n2.y)
+        return Rect(min(x1, x2) - 1, min(y1, y2) - 1, abs(x2-x1) + 3, abs(y2-y1) + 3)
+
+    def draw_node(self, node, rect):
+        pygame.draw.rect(self.surf, Palette.box_sep[node.state][0], rect)
+
+    def draw_link(self, link):
+        pygame.draw.line(self.surf, Palette.link[link.state][0], self.project(link.n1.x, link.n1.y), self.project(link.n2.x, link.n2.y))
+
+    def redraw_all(self):
+        """Renders the whole graph into a new surface"""
+        self.reset()
+        self.full = False
+        self.new_surface()
+
+        for link in Manager.links.values():
+            if link.n2 is None: continue
+            self.links[link.id] = self.link_rect(link)
+            self.draw_link(link)
+        for node in Manager.nodes.values():
+            self.nodes[node.id] = rect = self.node_rect(node)
+            self.draw_node(node, rect)
+
+    def new_surface(self):
+        """Creates an empty surface showing the whole graph with a margin, sets the rendered area"""
+        bounds = Bounds.get()
+        if bounds is None: x0, y0, x1, y1 = -1, -1, 1, 1
+        else: x0, y0, x1, y1 = bounds
+        mx, my = (x1-x0)*Minimap.MARGIN + 1, (y1-y0)*Minimap.MARGIN + 1
+        self.x0, self.y0 = x0-mx, y0-my
+        w, h = x1-x0 + mx*2, y1-y0 + my*2
+        self.scale = Minimap.SIZE/max(w, h)
+
+        self.surf = pygame.Surface((max(int(w*self.scale), 1), max(int(h*self.scale), 1)))
+        self.surf.fill(Palette.background)
+
+    def render_preview(self):
+        """Returns a render of the whole graph, stored in save files to preview them, see Graph.write_preview.
+        It is the minimap surface if displayed, otherwise a new render where only PREVIEW_OBJECTS nodes and links,
+        evenly spread in the dictionaries, are drawn"""
+        if self.enabled and self.surf is not None:
+            if self.full: self.redraw_all()
+            elif len(self.changed) or len(self.dirty): self.redraw_changes()
+            return self.surf
+
+        preview = Minimap()
+        preview.new_surface()
+        step = ceil((len(Manager.nodes) + len(Manager.links))/Minimap.PREVIEW_OBJECTS) or 1
+        for link in islice(Manager.links.values(), 0, None, step):
+            if link.n2 is not None: preview.draw_link(link)
+        for node in islice(Manager.nodes.values(), 0, None, step):
+            preview.draw_node(node, preview.node_rect(node))
+        return preview.surf
+
+    def redraw_changes(self):
+        """Redraws the region of the surface where objects changed"""
+        if len(self.changed) > (len(Manager.nodes) + len(Manager.links))/4:
+            self.redraw_all()
+            return
+
+        # update the positions of the changed objects
+        area = self.surf.get_rect()
+        for obj in self.changed:
+            if type(obj) == Node:
+                if Manager.nodes.get(obj.id) is not obj:
+                    self.nodes.pop(obj.id, None) # deleted
+                    continue
+                rect = self.nodes[obj.id] = self.node_rect(obj)
+            else:
+                if Manager.links.get(obj.id) is not obj or obj.n2 is None:
+                    self.links.pop(obj.id, None)
+                    continue
+                rect = self.links[obj.id] = self.link_rect(obj)
+
+            if not area.contains(rect):
+                self.redraw_all()
+                return
+            self.dirty.append(rect)
+
+        # redraw everything in the region
+        if len(self.dirty):
+            region = self.dirty[0].unionall(self.dirty[1:]).clip(area)
+            self.surf.set_clip(region)
+            self.surf.fill(Palette.background)
+
+            for id, _ in region.collidedictall(self.links, True):
+                self.draw_link(Manager.links[id])
+            nodes = [Manager.nodes[id] for id, _ in region.collidedictall(self.nodes, True)]
+            for node in sorted(nodes, key=lambda node: node.rank):
+                self.draw_node(node, self.nodes[node.id])
+            self.surf.set_clip(None)
+
+        self.dirty = []
+        self.changed = set()
+
+    def event(self, event):
+        """Moves the camera when clicking or dragging on the minimap.
+        Returns True if the event was used by the minimap"""
+        if not self.enabled: return False
+
+        if event.type == MOUSEBUTTONDOWN and event.button == 1 and self.rect.collidepoint(event.pos):
+            self.dragging = True
+        elif event.type == MOUSEBUTTONUP and event.button == 1 and self.dragging:
+            self.dragging = False
+            return True
+        elif not (event.type == MOUSEMOTION and self.dragging):
+            return False
+
+        x, y = event.pos
+        graph.scroll_x = (x-self.rect.x)/self.scale + self.x0
+        graph.scroll_y = (y-self.rect.y)/self.scale + self.y0
+        return True
+
+    def update(self):
+        """Updates the cached surface if needed, then displays it at the bottom right of the screen"""
+        if self.full: self.redraw_all()
+        elif ticks()-self.last_update >= Minimap.UPDATE_DELAY and (len(self.changed) or len(self.dirty)):
+            self.redraw_changes()
+            self.last_update = ticks()
+
+        w, h = self.surf.get_size()
+        self.rect = Rect(Graph.W-w-10, Graph.H-h-46, w, h)
+        pygame.draw.rect(screen, Palette.neutral, self.rect.inflate(4, 4), 2)
+        screen.blit(self.surf, self.rect)
+
+        # viewport outline
+        x0, y0 = self.project(*graph.screen2coord(0, 0))
+        x1, y1 = self.project(*graph.screen2coord(Graph.W, Graph.H))
+        view = Rect(x0 + self.rect.x, y0 + self.rect.y, max(x1-x0, 2), max(y1-y0, 2)).clip(self.rect)
+        if view.w and view.h:
+            pygame.draw.rect(screen, Palette.text, view, 1)
+
+class TileExporter:
+    """Renders the graph into a Deep Zoom tile pyramid, that can be displayed by web viewers such as OpenSeadragon:
+    a .dzi manifest, and a <name>_files directory containing one directory per level, with SIZE×SIZE png tiles.
+    The last level is rendered at zoom 1 like Graph.export, each previous level being half the size of the next.
+
+    The tiles are rendered by a pool of processes, each loading a snapshot of the graph saved into a temporary file.
+    For each level, the objects are sorted into the tiles they intersect, so each tile only draws its own objects.
+    The full image is never held in memory."""
+
+    SIZE = 256
+    TEXT_MIN_SCALE = 0.25 # texts are not drawn on smaller levels, where they would be bigger than the nodes
+
+    # state of the worker processes
+    current = None # exporter whose tiles are rendered by this process
+    buckets = {} # key: level, value: {(column, row): ([links], [nodes])}
+
+    def __init__(self, file, transparent):
+        self.manifest = splitext(file)[0]+'.dzi'
+        self.dir = splitext(file)[0]+'_files'
+        self.transparent = transparent
+
+        x0, y0, x1, y1 = Bounds.get()
+        self.origin = x0, y0
+        self.w, self.h = ceil((x1-x0)*Graph.unit_size) + 80, ceil((y1-y0)*Graph.unit_size) + 80
+        self.max_level = ceil(log2(max(self.w, self.h)))
+
+        self.progress = 0 # between 0 and 1
+        self.error = None # exception raised by a worker, if any
+
+    def level_info(self, level):
+        """Returns (scale, columns, rows) of a level"""
+        scale = 2**(level-self.max_level)
+        return scale, ceil(ceil(self.w*scale)/TileExporter.SIZE), ceil(ceil(self.h*scale)/TileExporter.SIZE)
+
+    def start(self):
+        """Writes the manifest and the snapshot, starts rendering the tiles in the background"""
+        with open(self.manifest, 'w') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="%d" Overlap="0" Format="png">'
+                    '<Size Width="%d" Height="%d"/></Image>\n' %(TileExporter.SIZE, self.w, self.h))
+
+        fd, self.snapshot = mkstemp(suffix='.graph')
+        os.close(fd)
+        graph.write_save(self.snapshot, False)
+
+        # one task per row of tiles, biggest levels first
+        tasks = []
+        for level in range(self.max_level, -1, -1):
+            os.makedirs(join(self.dir, str(level)), exist_ok=True)
+            tasks += [(level, row) for row in range(self.level_info(level)[2])]
+
+        # spawn instead of fork: the processes should not share the window
+        self.executor = ProcessPoolExecutor(mp_context=get_context('spawn'), initializer=TileExporter.init_worker,
+                                            initargs=(self, self.snapshot))
+        self.futures = [self.executor.submit(TileExporter.render_row, task) for task in tasks]
+
+    def done(self):
+        """Updates self.progress and self.error, returns True once every tile was rendered or an error occured"""
+        done = [future for future in self.futures if future.done()]
+        self.progress = len(done)/len(self.futures)
+        for future in done:
+            if future.exception() is not None:
+                self.error = future.exception()
+                return True
+        return len(done) == len(self.futures)
+
+    def stop(self):
+        """Stops the workers, cancelling the remaining tiles if any, and removes the snapshot"""
+        self.executor.shutdown(wait=self.error is None and self.progress == 1, cancel_futures=True)
+        try:
+            os.remove(self.snapshot)
+        except OSError:
+            pass # still opened by a worker being stopped
+
+    def __getstate__(self):
+        # only the geometry is sent to the workers
+        state = dict(self.__dict__)
+        for key in ('executor', 'futures'): state.pop(key, None)
+        return state
+
+    @staticmethod
+    def init_worker(exporter, snapshot):
+        """Runs in each worker process: initializes pygame without a window, and opens the snapshot"""
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        init()
+
+        loader = Loader(snapshot)
+        loader.load()
+        Manager.use(loader.document)
+        TileExporter.current = exporter
+        TileExporter.buckets = {}
+
+    @staticmethod
+    def sort_objects(level):
+        """Sorts the objects into the tiles of a level they intersect, in their drawing order"""
+        exporter = TileExporter.current
+        scale, cols, rows = exporter.level_info(level)
+        size = TileExporter.SIZE
+        x0, y0 = exporter.origin
+        buckets = {}
+
+        def add(index, obj, left, top, right, bottom):
+            for row in range(max(int(top//size), 0), min(int(bottom//size), rows-1)+1):
+                for col in range(max(int(left//size), 0), min(int(right//size), cols-1)+1):
+                    if (col, row) not in buckets: buckets[col, row] = ([], [])
+                    buckets[col, row][index].append(obj)
+
+        project = lambda x, y: (((x-x0)*Graph.unit_size + 40)*scale, ((y-y0)*Graph.unit_size + 40)*scale)
+
+        for link in Manager.links.values():
+            (lx1, ly1), (lx2, ly2) = project(link.n1.x, link.n1.y), project(link.n2.x, link.n2.y)
+            m = link.size*scale/2 + 1
+            add(0, link, min(lx1, lx2)-m, min(ly1, ly2)-m, max(lx1, lx2)+m, max(ly1, ly2)+m)
+
+        for node in Manager.nodes.values():
+            x, y = project(node.x, node.y)
+            s = node.size*scale/2
+            w = h = 0
+            if node.text_surfs is not None and scale >= TileExporter.TEXT_MIN_SCALE:
+                w, h = node.text_surfs[1].get_size()
+                h += 5
+            add(1, node, x - max(s, w/2), y-s, x + max(s, w/2), y+s+h)
+
+        return buckets
+
+    @staticmethod
+    def render_row(task):
+        """Runs in a worker process: renders and saves a row of tiles, returns the number of tiles"""
+        level, row = task
+        exporter = TileExporter.current
+        scale, cols, _ = exporter.level_info(level)
+        size = TileExporter.SIZE
+        x0, y0 = exporter.origin
+
+        if level not in TileExporter.buckets:
+            TileExporter.buckets = {level: TileExporter.sort_objects(level)} # levels are rendered one after the other
+        buckets = TileExporter.buckets[level]
+
+        graph.zoom = scale # size of the nodes and links
+        force_text = True if scale >= TileExporter.TEXT_MIN_SCALE else None
+        width, height = ceil(exporter.w*scale), ceil(exporter.h*scale)
+
+        for col in range(cols):
+            # the last tiles of a row or column are cut to the image size
+            surf = pygame.Surface((min(size, width - col*size), min(size, height - row*size)), SRCALPHA)
+            if not exporter.transparent: surf.fill(Palette.background)
+
+            tx, ty = col*size, row*size
+            project = lambda x, y: (((x-x0)*Graph.unit_size + 40)*scale - tx, ((y-y0)*Graph.unit_size + 40)*scale - ty)
+            links, nodes = buckets.get((col, row), ((), ()))
+            for link in links: link.update([], surf, project)
+            for node in nodes: node.update([], surf, project, force_text)
+
+            pygame.image.save(surf, join(exporter.dir, str(level), '%d_%d.png' %(col, row)))
+
+        return cols
+
 class Graph:
     """Graph manager, for displaying the graph, handling scroll, and updating elements"""
     W = 900
     H = 500
 
     unit_size = 100 # graph unit to pixel ratio
+    SAVE_BLOCK = 4096 # lines of save.txt and exported files generated before being written, see write_blocks
 
     def __init__(self):
         assert Palette.init
@@ -865,16 +3187,31 @@ class Graph:
         # movement utilities
         self.drag_start = None # moved/scroll element pos when drag started
         self.drag_mouse_start = None # mouse pos when drag started
+        # dragged nodes and their links: they are drawn with an offset, and only moved when the drag ends
+        self.dragged = set()
+        self.dragged_links = set()
+        self.drag_offset = (0, 0) # in graph coordinates
 
         self.selection = [] # self.selection contains the list of selected objects
+        self.selected = set() # same objects, for fast membership checks
         self.selection_box = None # contains start position when selecting, otherwise None
         self.hovered = None # hovered Graph object
         self.link = None # if link in construction, store it here, else None
+        self.layout = None # automatic layout being run, if any
+        self.show_progression = False # show which nodes are available or locked
+
+        # search bar: query, None if closed, IDs of the matching nodes, and the match the camera is on
+        self.search = None
+        self.search_ids = []
+        self.search_index = 0
+        self.locked_surfs = {} # filters drawn over the locked nodes, key: size in pixels
 
         self.ui = UI()
+        self.minimap = Minimap()
 
         # debug information
         self.debug_surf = None
+        self.profiler = Profiler()
 
         self.changes = False # set to True when changed something (will trigger a popup on close)
 
@@ -923,219 +3260,347 @@ class Graph:
 
         self.debug_surf.blit(font.render(text, True, Palette.text), (0, y))
 
-    def open(self, save_file):
-        """Sets self.save_file and loads save file"""
+    def open(self, save_file, new=False):
+        """Sets self.save_file and loads save file, in a new document next to the current one if new is True.
+        The file is loaded on a worker thread while a progress bar is displayed,
+        and the current objects are only replaced if loading was successful."""
 
-        # make a backup in case something goes wrong and the file fails to open
-        backup = [dict(Manager.nodes), dict(Manager.links), dict(Manager.images),
-                  self.scroll_x, self.scroll_y, self.zoom]
-        Manager.reset()
+        if Chunks.is_chunked(save_file):
+            self.open_chunked(save_file, new)
+            return
 
-        success = True
-        try:
-            lines = [] # in case there's an error and it doesn't get defined
+        loader = Loader(save_file)
 
-            other_files = {} # file name: content
-            with ZipFile(save_file) as z:
-                lines = z.read('save.txt').decode().split('\n')
-                for file in z.filelist:
-                    file = file.filename
-                    if file != 'save.txt':
-                        other_files[file] = z.read(file)
+        # don't record the loaded objects as changes, they are indexed by the loader
+        Journal.recording = False
+        Search.indexing = False
+        loader.start()
 
-        except Exception as e:
-            Error.zipfile(e)
-            success = False
+        old_screen, background = get_popup_bg('Loading %s...' %basename(save_file))
+        cancel = Button('Cancel', Graph.W/2, Graph.H*2/3)
+        bar = Rect(Graph.W*0.25, Graph.H/2 - 8, Graph.W*0.5, 16)
 
-        for y, raw in enumerate(lines):
-            # format line: remove leading and trailing spaces, double spaces, comments
-            line = ''
-            prev = ' '
-            for c in raw:
-                if c == prev == ' ': continue
-                if c == '#': break
-                line += c
-                prev = c
-            line = line.rstrip()
-            if not line: continue
+        while not loader.done():
+            events = Input.poll()
+            for event in events:
+                if event.type == QUIT:
+                    loader.cancel()
+                    pygame.event.post(pygame.event.Event(QUIT))
+                elif event.type == KEYDOWN and event.key == K_ESCAPE:
+                    loader.cancel()
+                elif event.type == VIDEORESIZE:
+                    graph.resize()
 
-            # get command from line
-            line = line.split(' ')
-            cmd = line[0]
-            args = line[1:]
+            screen.blit(background, (0, 0))
 
-            # execute action depending on command
-            match cmd:
-                case 'P': # add new node
-                    if len(args) != 5:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        Manager.new_node(*args)
-                    except:
-                        Error.corrupted_file('wrong node values: '+raw, success)
-                case 'L': # add new link
-                    if len(args) != 3:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        Manager.new_link(*args)
-                    except:
-                        Error.corrupted_file('wrong link values: '+raw, success)
-                case 'I': # add new image
-                    if len(args) != 2:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        name, id = args
-                        content = other_files[name]
-                        Manager.new_image(name, content, id)
-                    except:
-                        Error.corrupted_file('wrong image values: '+raw, success)
-                        success = False
-                case 'Ai': # attach an image to a node
-                    if len(args) != 2:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        Manager.attach_image(*args)
-                    except:
-                        Error.corrupted_file('error while attaching image: '+raw, success)
-                        success = False
-                case 'At': # attach text to a node
-                    if len(args) != 2:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        Manager.attach_text(args[0], args[1].replace('\0', ' '))
-                    except:
-                        Error.corrupted_file('error while attaching text: '+raw, success)
-                        success = False
+            # progress bar
+            pygame.draw.rect(screen, Palette.neutral, bar)
+            pygame.draw.rect(screen, Palette.text, Rect(bar.x, bar.y, bar.w*loader.progress, bar.h))
 
-                case '_S':
-                    if len(args) != 2:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        self.scroll_x, self.scroll_y = float(args[0]), float(args[1])
-                    except:
-                        Error.corrupted_file('invalid scroll position', success)
-                case '_Z':
-                    if len(args) != 1:
-                        Error.syntax(y, raw)
-                        success = False
-                    try:
-                        self.zoom = float(args[0])
-                    except:
-                        Error.corrupted_file('invalid zoom value', success)
-                    if not self.zoom: # forbidden value: reset zoom
-                        self.zoom = 1
-                case _:
-                    Error.syntax(y, raw)
-                    success = False
+            if cancel.update(events): loader.cancel()
 
-            if not success: break
+            pygame.display.flip()
+            clock.tick(FPS)
 
-        if success:
-            self.open_successful(save_file)
-            for d in backup: del d
-        else:
-            # unload the objects and restore the previous ones
-            # manually deleting makes for less memory usage
-            del Manager.links
-            del Manager.images
-            del Manager.nodes # nodes last because then they no longer have any references
-            Manager.nodes, Manager.links, Manager.images, self.scroll_x, self.scroll_y, self.zoom = backup
+        Journal.recording = True
+        Search.indexing = True
+        screen.blit(old_screen, (0, 0))
+
+        for function, args in loader.errors:
+            function(*args)
+
+        if loader.success:
+            # replace the objects all at once
+            if new:
+                Manager.document.store()
+                Manager.use(loader.document)
+            else: Manager.replace(loader.document)
+            if loader.scroll is not None: self.scroll_x, self.scroll_y = loader.scroll
+            if loader.zoom is not None: self.zoom = loader.zoom
+
+            Search.reset(*loader.search)
+            LinkIndex.reset(*loader.link_index)
+            Bounds.reset(*loader.bounds)
+            Chunks.reset()
+            if Formats.get(save_file) is None:
+                Journal.reset(save_file, loader.image_ids, loader.journal_size, loader.journal_entries)
+                self.open_successful(save_file)
+            else:
+                # imported files are saved into a new save file
+                Journal.reset(None)
+                self.open_successful(None)
+                self.changes = True
+                set_title(None)
+                self.fit()
+        else: loader.document.close()
+
+    def open_chunked(self, save_file, new=False):
+        """Opens a chunked save file, its chunks will then be loaded by Chunks.update.
+        The current document is only replaced once the index of the file was read successfully."""
+        try:
+            document, cells, next_ids, scroll, zoom = Chunks.open(save_file)
+        except Exception as e:
+            Error.zipfile(e)
+            return
+
+        if new: Manager.document.store()
+        Manager.reset(new, document)
+        Chunks.reset(save_file, cells, next_ids)
+        if scroll is not None: self.scroll_x, self.scroll_y = scroll
+        if zoom is not None: self.zoom = zoom
+        Journal.reset(None)
+        self.open_successful(save_file)
 
     def open_successful(self, save_file):
         """If opening a file was successful, prepare graph (reset variables)"""
         self.save_file = save_file
+        self.reset_state()
+        self.changes = False
+        set_title(save_file, False)
 
-        # reset variables
+    def stop_drag(self):
+        """Forgets the dragged nodes, once dropped or deleted"""
         self.drag_start = None
         self.drag_mouse_start = None
+        self.dragged, self.dragged_links = set(), set()
+        self.drag_offset = (0, 0)
+
+    def reset_state(self):
+        """Resets the selection, the objects being edited and the minimap, when the current document changes"""
+        self.stop_drag()
         self.selection = []
+        self.selected = set()
+        self.search = None
         self.hovered = None
         self.hovered_l = None
         self.link = None
-        self.changes = False
-        set_title(save_file, False)
+        self.layout = None
+        self.minimap.reset()
         self.ui.update_surf()
 
-    def save(self):
-        """Saves graph contents into self.save_file"""
+    def use_document(self, document):
+        """Makes an open document the current one, restoring its state"""
+        Manager.use(document)
+        document.restore()
+        self.reset_state()
+        set_title(self.save_file, self.changes)
+
+    def switch_document(self, step):
+        """Switches to the next open document, or the previous one if step is -1"""
+        documents = Manager.documents
+        if len(documents) < 2: return
+        Manager.document.store()
+        self.use_document(documents[(documents.index(Manager.document) + step) % len(documents)])
+
+    def close_document(self):
+        """Closes the current document, asking to save its changes, and switches to the previous one.
+        Closing the only document starts a new file instead."""
+        if self.changes:
+            res = want_to_save()
+            if res is None: return
+            if res == 0:
+                if self.save_file is None: self.saveas()
+                else: self.save()
+                if self.changes: return # the file dialog was cancelled
+
+        documents = Manager.documents
+        if len(documents) == 1:
+            self.newfile()
+            return
 
-        if self.save_file is None: raise ValueError('No save loaded')
+        document = Manager.document
+        i = documents.index(document)
+        documents.pop(i)
+        document.close()
+        self.use_document(documents[i-1])
+
+    def draw_documents(self):
+        """Displays the names of the open documents at the bottom left of the screen, the current one outlined"""
+        x = 10
+        for document in Manager.documents:
+            current = document is Manager.document
+            file, changes = (self.save_file, self.changes) if current else (document.save_file, document.changes)
+            name = '[no file]' if file is None else splitext(basename(file))[0]
+            if changes: name = '*%s*' %name
+
+            text = font.render(name, True, Palette.text)
+            rect = Rect(x, Graph.H - 36, text.get_width() + 16, 26)
+            pygame.draw.rect(screen, Palette.neutral, rect)
+            if current: pygame.draw.rect(screen, Palette.text, rect, 1)
+            screen.blit(text, (rect.x + 8, rect.y + 5))
+            x = rect.right + 4
 
-        # general information
-        content = ['# GENERAL INFO',
-                   '_S %f %f' %(self.scroll_x, self.scroll_y),
-                   '_Z %f' %(self.zoom)]
+    def save(self):
+        """Saves graph contents into self.save_file.
+        When possible, only the changes since the last save are appended to the file's journal."""
 
-        # nodess
-        content += ('', '# NODES')
-        for id, node in Manager.nodes.items():
-            content.append('P %f %f %d %d %d' %(node.x, node.y, node.rank, node.state, id))
+        if self.save_file is None: raise ValueError('No save loaded')
 
-        # links
-        content += ('', '# LINKS')
-        for id, link in Manager.links.items():
-            content.append('L %d %d %d' %(link.n1.id, link.n2.id, id))
+        if Chunks.file is not None:
+            Chunks.save(self.save_file, (self.scroll_x, self.scroll_y), self.zoom)
+            Journal.clear()
+        elif Journal.can_append(self.save_file): self.save_journal()
+        else: self.save_full()
 
-        # images
-        content += ('', '# IMAGES')
-        for id, image in Manager.images.items():
-            # check if this image is used in the graph, otherwise don't save it
-            used = False
-            for node in Manager.nodes.values():
-                if node.image == image:
-                    used = True
-                    break
+        self.changes = False
+        set_title(self.save_file)
 
-            if used:
-                content.append('I %s %d' %(image.path, image.id))
+    def save_full(self):
+        """Rewrites the whole save file, compacting its journal"""
+        used_image_ids = self.write_save(self.save_file)
+        Journal.reset(self.save_file, used_image_ids)
 
-        # images attached to nodes
-        content += ('', '# LINK IMAGES')
-        used_image_ids = []
-        for id, node in Manager.nodes.items():
-            if node.image is not None:
-                content.append('Ai %d %d' %(id, node.image.id))
-                used_image_ids.append(node.image.id)
+    @staticmethod
+    def write_blocks(f, lines):
+        """Writes the lines generated by the iterator into the binary file f, joined by blocks of SAVE_BLOCK lines"""
+        while block := ''.join(islice(lines, Graph.SAVE_BLOCK)):
+            f.write(block.encode())
+
+    def stats(self):
+        """Returns the stats of the graph written into save files, as JSON"""
+        return dumps({'nodes': len(Manager.nodes),
+                      'links': len(Manager.links) - (self.link is not None), # without the link being created
+                      'images': Manager.document.used_images,
+                      'bounds': Bounds.get()})
+
+    def write_preview(self, z):
+        """Writes a preview of the graph and its stats into the open zip file z, as preview.png and preview.json.
+        They are read by read_preview, without loading the file"""
+        data = BytesIO()
+        pygame.image.save(self.minimap.render_preview(), data, 'preview.png')
+        z.writestr('preview.png', data.getvalue())
+        z.writestr('preview.json', self.stats())
+
+    def write_save(self, file, preview=True):
+        """Writes the whole graph into a save file, returns the IDs of the saved images.
+        The preview is only needed in the files saved by the user, not in the snapshots of TileExporter."""
+
+        # only the images used in the graph are saved
+        images = [image for image in Manager.images.values() if image.users]
+        bounds = Bounds.get()
+        attached_images = [] # lines of the images and text attached to nodes, written after the images
+        texts = []
+
+        def lines():
+            # general information
+            yield '# GENERAL INFO\n_S %f %f\n_Z %f\n' %(self.scroll_x, self.scroll_y, self.zoom)
+            if bounds is not None: yield '_B %f %f %f %f\n' %bounds
+
+            # nodes, iterated once for all the sections
+            yield '\n# NODES\n'
+            for id, node in Manager.nodes.items():
+                yield 'P %f %f %d %d %d\n' %(node.x, node.y, node.rank, node.state, id)
+                if node.image is not None: attached_images.append('Ai %d %d\n' %(id, node.image.id))
+                if node.text: texts.append('At %d %s\n' %(id, node.text.replace(' ', '\0')))
+
+            # links
+            yield '\n# LINKS\n'
+            for id, link in Manager.links.items():
+                if link.n2 is not None: # skip the link being created
+                    yield 'L %d %d %d\n' %(link.n1.id, link.n2.id, id)
+
+            # images
+            yield '\n# IMAGES\n'
+            for image in images:
+                yield 'I %s %d\n' %(image.path, image.id)
+
+            # images attached to nodes
+            yield '\n# LINK IMAGES\n'
+            yield from attached_images
+
+            # text attached to nodes
+            yield '\n# TEXT\n'
+            yield from texts
+
+        with ZipFile(file, 'w') as z:
+            # the main save file is written into the zip file while it is generated
+            with z.open('save.txt', 'w') as f:
+                Graph.write_blocks(f, lines())
 
-        # text attached to nodes
-        content += ('', '# TEXT')
-        for id, node in Manager.nodes.items():
-            if node.text:
-                content.append('At %d %s' %(id, node.text.replace(' ', '\0')))
+            # encode the width, height and image data into image files
+            for image in images:
+                z.writestr(image.path, image.encode())
 
-        # save into zip file
-        with ZipFile(self.save_file, 'w') as z:
-            # add the main save file into the zip file
-            z.writestr('save.txt', '\n'.join(content)+'\n')
+            if preview: self.write_preview(z)
 
-            # encode the width, height and image data into image files
-            for id in set(used_image_ids):
-                image = Manager.images[id]
-                w, h = image.surf.get_size()
-                content = b'%d.%d.%s' %(w, h, pygame.image.tostring(image.surf, 'RGBA'))
-                z.writestr(image.path, content)
+        return [image.id for image in images]
 
-        self.changes = False
-        set_title(self.save_file)
+    def save_journal(self):
+        """Appends the changes made since the last save to the save file, as a new journal entry.
+        The entry uses the same commands as save.txt, plus Dn, Dl, Di and Dt to delete nodes and links,
+        or detach images and text from nodes."""
 
-    def newfile(self):
-        Manager.reset()
+        content = ['_S %f %f' %(self.scroll_x, self.scroll_y),
+                   '_Z %f' %(self.zoom)]
+        bounds = Bounds.get()
+        if bounds is not None: content.append('_B %f %f %f %f' %bounds)
+
+        # deletions first, as the IDs may have been reused by new objects since
+        for id in Journal.removed_links: content.append('Dl %d' %id)
+        for id in Journal.removed_nodes: content.append('Dn %d' %id)
+
+        nodes = [Manager.nodes[id] for id in Journal.nodes if id in Manager.nodes]
+        links = [Manager.links[id] for id in Journal.links if id in Manager.links]
+
+        # images used by the changed nodes that are not in the file yet
+        images = {}
+        for node in nodes:
+            if node.image is not None and node.image.id not in Journal.images:
+                images[node.image.id] = node.image
+        for id, image in images.items():
+            content.append('I %s %d' %(image.path, id))
+
+        for node in nodes:
+            content.append('P %f %f %d %d %d' %(node.x, node.y, node.rank, node.state, node.id))
+        for link in links:
+            if link.n2 is not None:
+                content.append('L %d %d %d' %(link.n1.id, link.n2.id, link.id))
+        for node in nodes:
+            if node.image is None: content.append('Di %d' %node.id)
+            else: content.append('Ai %d %d' %(node.id, node.image.id))
+            if node.text: content.append('At %d %s' %(node.id, node.text.replace(' ', '\0')))
+            else: content.append('Dt %d' %node.id)
+
+        content = ('\n'.join(content)+'\n').encode()
+        # the preview is only rendered by full saves, but the stats are kept up to date
+        stats = self.stats().encode()
+
+        with ZipFile(self.save_file, 'a') as z:
+            names = set(z.namelist())
+            for image in images.values():
+                if image.path not in names:
+                    z.writestr(image.path, image.encode())
+            z.writestr('journal/%06d.txt' %Journal.entries, content)
+            z.writestr('stats/%06d.json' %Journal.entries, stats)
+
+        Journal.images.update(images)
+        Journal.size += len(content) + len(stats)
+        Journal.entries += 1
+        Journal.clear()
+
+    def newfile(self, new=False):
+        """Starts a new file, in a new document next to the current one if new is True"""
+        if new: Manager.document.store()
+        Manager.reset(new)
+        Journal.reset(None)
         self.open_successful(None)
 
-    def saveas(self):
+    def saveas(self, chunked=False):
+        """Saves into a new file, converting the graph to a chunked save file if chunked is True.
+        Chunked graphs always stay chunked, as their nodes might not all be loaded."""
         file = ask_filename(True)
         if file != '':
             self.save_file = file
-            self.save()
-
-    def export(self, transparent):
-        """Exports the graph into a png image, either with Palette.background background or no background.
+            if chunked and Chunks.file is None:
+                Chunks.save(file, (self.scroll_x, self.scroll_y), self.zoom)
+                Journal.reset(None)
+                self.changes = False
+                set_title(file)
+            else: self.save()
+
+    def export(self, transparent, svg=False):
+        """Exports the graph into a png image, or an svg image if svg is True,
+        either with Palette.background background or no background.
         The render is done at zoom 1, and a margin of 20px is added around the graph.
         There needs to be at least one element in the graph for it to be rendered.
         Very large graphs might MemoryError, might have to export to another zoom. TODO?
@@ -1145,12 +3610,13 @@ class Graph:
             ask_button('Cannot render an empty graph.', [(0, 'OK')])
             return
 
+        ext = '.svg' if svg else '.png'
         if self.save_file is None: file = None
-        else: file = splitext(basename(self.save_file))[0]+'.png'
-        file = asksaveasfilename(title='Export to file', filetypes=(('PNG files', '.png'),), initialfile=file)
+        else: file = splitext(basename(self.save_file))[0]+ext
+        file = asksaveasfilename(title='Export to file', filetypes=((ext[1:].upper()+' files', ext),), initialfile=file)
         pygame.event.get()
         if not file: return
-        if not file.endswith('.png'): file += '.png'
+        if not file.endswith(ext): file += ext
         self.select(None)
 
         # display a loading screen
@@ -1158,29 +3624,93 @@ class Graph:
         screen.blit(background, (0, 0))
         pygame.display.flip()
 
-        # get the bounding boxes
-        x0 = y0 = x1 = y1 = None
-        for node in Manager.nodes.values():
-            if node.text_surfs is None: w = h = 0
-            else: w, h = node.text_surfs[1].get_size()
+        try:
+            if svg: self.export_svg_to(file, transparent)
+            else: self.export_to(file, transparent)
+        except MemoryError:
+            ask_button('A MemoryError occured.\nMaybe try to lower the size of your graph.', [(0, 'OK')])
+
+        # reset the screen to as it was before for safety
+        screen.blit(old_screen, (0, 0))
+        pygame.display.flip()
 
-            offsettop = node.size/2/Graph.unit_size
-            offsetx = max(offsettop, w/2/Graph.unit_size)
-            offsetbtm = offsettop + (5+h)/Graph.unit_size
+    def export_format(self):
+        """Exports the graph into one of the formats of Formats, depending on the file extension"""
 
-            if x0 is None or node.x-offsetx < x0: x0 = node.x-offsetx
-            if y0 is None or node.y-offsettop < y0: y0 = node.y-offsettop
-            if x1 is None or node.x+offsetx > x1: x1 = node.x+offsetx
-            if y1 is None or node.y+offsetbtm > y1: y1 = node.y+offsetbtm
+        if self.save_file is None: file = None
+        else: file = splitext(basename(self.save_file))[0]
+        file = asksaveasfilename(title='Export to file', filetypes=Formats.filetypes(), initialfile=file)
+        pygame.event.get()
+        if not file: return
+        format = Formats.get(file)
+        if format is None:
+            format = Formats.formats[0]
+            file += format.EXTENSIONS[0]
+        self.select(None)
 
-        w, h = (x1-x0)*Graph.unit_size, (y1-y0)*Graph.unit_size
+        old_screen, background = get_popup_bg('Exporting... Please wait.')
+        screen.blit(background, (0, 0))
+        pygame.display.flip()
 
-        try:
-            surf = pygame.Surface((w+80, h+80), SRCALPHA)
-        except MemoryError:
-            ask_button('A MemoryError occured.\nMaybe try to lower the size of your graph.', [(0, 'OK')])
+        Formats.export(file, format)
+
+        screen.blit(old_screen, (0, 0))
+        pygame.display.flip()
+
+    def export_tiles(self):
+        """Exports the graph into a tile pyramid (see TileExporter), displaying the progress"""
+
+        if not len(Manager.nodes):
+            ask_button('Cannot render an empty graph.', [(0, 'OK')])
             return
 
+        if self.save_file is None: file = None
+        else: file = splitext(basename(self.save_file))[0]+'.dzi'
+        file = asksaveasfilename(title='Export to tiles', filetypes=(('Deep Zoom images', '.dzi'),), initialfile=file)
+        pygame.event.get()
+        if not file: return
+        self.select(None)
+
+        exporter = TileExporter(file, False)
+        exporter.start()
+
+        old_screen, background = get_popup_bg('Rendering tiles...')
+        cancel = Button('Cancel', Graph.W/2, Graph.H*2/3)
+        bar = Rect(Graph.W*0.25, Graph.H/2 - 8, Graph.W*0.5, 16)
+
+        cancelled = False
+        while not cancelled and not exporter.done():
+            events = Input.poll()
+            for event in events:
+                if event.type == QUIT:
+                    pygame.event.post(pygame.event.Event(QUIT))
+                    cancelled = True
+                elif event.type == KEYDOWN and event.key == K_ESCAPE:
+                    cancelled = True
+                elif event.type == VIDEORESIZE:
+                    graph.resize()
+
+            screen.blit(background, (0, 0))
+            pygame.draw.rect(screen, Palette.neutral, bar)
+            pygame.draw.rect(screen, Palette.text, Rect(bar.x, bar.y, bar.w*exporter.progress, bar.h))
+            if cancel.update(events): cancelled = True
+
+            pygame.display.flip()
+            clock.tick(FPS)
+
+        exporter.stop()
+        screen.blit(old_screen, (0, 0))
+        if exporter.error is not None:
+            ask_button('Error while rendering the tiles:\n%s' %exporter.error, [(0, 'OK')])
+
+    def export_to(self, file, transparent):
+        """Renders the graph into a png file, without any dialog. Used by export.
+        Raises MemoryError if the graph is too big to be rendered."""
+
+        x0, y0, x1, y1 = Bounds.get()
+        w, h = (x1-x0)*Graph.unit_size, (y1-y0)*Graph.unit_size
+        surf = pygame.Surface((w+80, h+80), SRCALPHA)
+
         if not transparent:
             surf.fill(Palette.background)
 
@@ -1194,57 +3724,256 @@ class Graph:
 
         pygame.image.save(surf, file)
 
-        # reset the screen to as it was before for safety
-        screen.blit(old_screen, (0, 0))
-        pygame.display.flip()
+    def export_svg_to(self, file, transparent):
+        """Writes the graph into an svg file, without any dialog. Used by export.
+        The objects are written one by one while iterating over them, so the memory used doesn't depend on the graph size.
+        Each image is written once, when first used, and then referenced by the nodes."""
+        from xml.sax.saxutils import escape
+
+        x0, y0, x1, y1 = Bounds.get()
+        w, h = (x1-x0)*Graph.unit_size + 80, (y1-y0)*Graph.unit_size + 80
+        project = lambda x, y: ((x-x0)*Graph.unit_size + 40, (y-y0)*Graph.unit_size + 40)
+        rgb = lambda col: 'rgb(%d,%d,%d)' %col[:3]
+
+        with open(file, 'w', encoding='utf-8') as f:
+            f.write('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                    'width="%d" height="%d" viewBox="0 0 %d %d">\n' %(w, h, w, h))
+
+            # one class per state for the colors of the links and of the node boxes
+            f.write('<style>\n')
+            for i in range(3):
+                f.write('.l%d{stroke:%s}.m%d{stroke:%s}' %(i, rgb(Palette.link[i][0]), i, rgb(Palette.link2[i][0])))
+                f.write('.o%d{fill:%s}.s%d{fill:%s}.i%d{fill:%s}\n' %(i, rgb(Palette.box_outer[i][0]),
+                        i, rgb(Palette.box_sep[i][0]), i, rgb(Palette.box_inner[i][0])))
+            f.write('text{font:12px Consolas,monospace;fill:%s;text-anchor:middle}' %rgb(Palette.text))
+            f.write('.b{fill:%s;fill-opacity:0.5}\n</style>\n' %rgb(Palette.background))
+
+            if not transparent:
+                f.write('<rect width="100%%" height="100%%" fill="%s"/>\n' %rgb(Palette.background))
+
+            for link in Manager.links.values():
+                if link.n2 is None: continue
+                (lx1, ly1), (lx2, ly2) = project(link.n1.x, link.n1.y), project(link.n2.x, link.n2.y)
+                coords = 'x1="%.1f" y1="%.1f" x2="%.1f" y2="%.1f"' %(lx1, ly1, lx2, ly2)
+                f.write('<line class="l%d" %s stroke-width="%g"/>\n' %(link.state, coords, link.size))
+                if link.size >= 3:
+                    f.write('<line class="m%d" %s stroke-width="%d"/>\n' %(link.state, coords, link.size/3))
+
+            images = set() # IDs of the images already written
+            for node in Manager.nodes.values():
+                x, y = project(node.x, node.y)
+                s = node.size
+                m = int(s/10)
+                left, top = x - s/2, y - s/2
+
+                # box, same as in Node.set_image
+                f.write('<rect class="o%d" x="%.1f" y="%.1f" width="%d" height="%d"/>' %(node.state, left, top, s, s))
+                f.write('<rect class="s%d" x="%.1f" y="%.1f" width="%d" height="%d"/>'
+                        %(node.state, left+m-2, top+m-2, s - m*2 + 4, s - m*2 + 4))
+                f.write('<rect class="i%d" x="%.1f" y="%.1f" width="%d" height="%d"/>\n'
+                        %(node.state, left+m, top+m, s - m*2, s - m*2))
+
+                if node.image is not None:
+                    image = node.image
+                    iw, ih = image.surf.get_size()
+                    if image.id not in images:
+                        images.add(image.id)
+                        png = BytesIO()
+                        pygame.image.save(image.surf, png, 'png')
+                        f.write('<defs><image id="image%d" width="%d" height="%d" xlink:href="data:image/png;base64,%s"/></defs>\n'
+                                %(image.id, iw, ih, b64encode(png.getvalue()).decode()))
+
+                    scale = (s - m*2 - 2)/max(iw, ih)
+                    f.write('<use xlink:href="#image%d" transform="translate(%.1f %.1f) scale(%g)"/>\n'
+                            %(image.id, left+m+1, top+m+1, scale))
+
+                if node.text:
+                    lines = Node.wrap_text(node.text) if len(node.text)*char_w2 > Node.TEXT_WIDTH else [node.text]
+                    tw = max(len(line) for line in lines)*char_w2
+                    f.write('<rect class="b" x="%.1f" y="%.1f" width="%d" height="%d"/>' %(x - tw/2, top+s+5, tw, 12*len(lines)))
+                    f.write('<text>')
+                    for i, line in enumerate(lines):
+                        f.write('<tspan x="%.1f" y="%.1f">%s</tspan>' %(x, top+s+15 + i*12, escape(line)))
+                    f.write('</text>\n')
+
+            f.write('</svg>\n')
 
     def project(self, x, y):
         """Returns the position, in screen coordinates, corresponding to a position in graph coordinates"""
         z = self.zoom * Graph.unit_size
         return (x - self.scroll_x) * z + self.W/2, (y - self.scroll_y) * z + self.H/2
 
+    def fit(self):
+        """Moves the camera and zooms to show the whole graph, with a margin, without zooming in more than 1"""
+        bounds = Bounds.get()
+        if bounds is None: x0, y0, x1, y1 = -1, -1, 1, 1
+        else: x0, y0, x1, y1 = bounds
+        self.scroll_x, self.scroll_y = (x0+x1)/2, (y0+y1)/2
+        w, h = (x1-x0)*Graph.unit_size + 80, (y1-y0)*Graph.unit_size + 80
+        self.zoom = min(Graph.W/w, Graph.H/h, 1)
+        self.ui.refresh_zoom()
+
     def screen2coord(self, x, y):
         """Returns the position, in graph coordinates, corresponding to a position in screen coordinates"""
         z = self.zoom * Graph.unit_size
         return (x - self.W/2) / z + self.scroll_x, (y - self.H/2) / z + self.scroll_y
 
+    def start_layout(self, layered):
+        try:
+            self.layout = Layout(Manager.nodes.values(), Manager.links.values(), layered)
+        except ImportError:
+            ask_button('The automatic layout requires numpy.', [(0, 'OK')])
+
+    def stop_layout(self, keep=True):
+        """Stops the automatic layout, keeping the new positions or restoring the previous ones"""
+        if keep:
+            for node in self.layout.nodes:
+                Journal.changed_node(node)
+            self.changes = True
+            set_title(self.save_file, True)
+        else:
+            self.layout.restore()
+        self.layout = None
+
+    def draw_progression(self, nodes):
+        """Outlines the available nodes and darkens the locked ones (with uncompleted prerequisites)"""
+        for node in nodes:
+            if node.state == Node.COMPLETED: continue
+
+            x, y = self.project(node.x, node.y)
+            s = node.size if self.zoom > 1 else node.size*self.zoom
+            if node.pending:
+                size = int(s)
+                if size not in self.locked_surfs:
+                    self.locked_surfs[size] = pygame.Surface((size, size), SRCALPHA)
+                    self.locked_surfs[size].fill(Palette.locked)
+                screen.blit(self.locked_surfs[size], (x - size/2, y - size/2))
+            else:
+                pygame.draw.rect(screen, Palette.available, Rect(x - s/2 - 3, y - s/2 - 3, s+6, s+6), 2)
+
+    def search_input(self, event):
+        """Handles a key press while the search bar is open.
+        The matching nodes are selected, and the camera is centered on one of them."""
+        query = self.search
+        if event.key == K_ESCAPE:
+            self.search = None
+            return
+        elif event.key in (K_RETURN, K_KP_ENTER):
+            # go to the next (or previous, with Shift) match
+            if len(self.search_ids):
+                step = -1 if event.mod & KMOD_SHIFT else 1
+                self.search_index = (self.search_index + step) % len(self.search_ids)
+                self.search_jump()
+            return
+        elif event.key == K_BACKSPACE:
+            self.search = query[:-1]
+            self.search_ids = Search.find(self.search)
+        elif event.unicode and event.unicode.isprintable():
+            self.search = query + event.unicode
+            # a longer query can only match a subset of the previous matches
+            within = self.search_ids if query else None
+            self.search_ids = Search.find(self.search, within)
+        else: return
+
+        # matches in creation order
+        nodes = Manager.nodes
+        self.search_ids.sort()
+        self.set_selection(nodes[id] for id in self.search_ids)
+        self.search_index = 0
+        self.search_jump()
+
+    def search_jump(self):
+        """Centers the camera on the current search match"""
+        if len(self.search_ids):
+            node = Manager.nodes.get(self.search_ids[self.search_index])
+            if node is not None: self.scroll_x, self.scroll_y = node.x, node.y # might be unloaded, see Chunks
+
+    def draw_search(self):
+        """Displays the search bar at the bottom right of the screen"""
+        if len(self.search_ids):
+            info = '%d/%d' %(self.search_index+1, len(self.search_ids))
+        else: info = 'no match' if self.search else ''
+
+        w = 400
+        rect = Rect(Graph.W - w - 10, Graph.H - 36, w, 26)
+        pygame.draw.rect(screen, Palette.neutral, rect)
+
+        text = font.render(info, True, Palette.text)
+        screen.blit(text, (rect.right - 8 - text.get_width(), rect.y + 5))
+        # only show the end of long queries
+        chars = int((w - 24 - text.get_width())/char_w) - len('Search: _')
+        screen.blit(font.render('Search: %s_' %self.search[-chars:], True, Palette.text), (rect.x + 8, rect.y + 5))
+
     def select(self, obj):
         """Sets self.selection to obj and updates self.ui"""
-        self.selection = [] if obj is None else [obj]
+        self.set_selection([] if obj is None else [obj])
+
+    def set_selection(self, objs):
+        """Sets self.selection to the list of objects and updates self.ui"""
+        self.selection = list(objs)
+        self.selected = set(self.selection)
         self.ui.update_surf()
 
     def update(self, events):
         """Updates objects and menu, displays the graph"""
+        profiler = self.profiler
+        t = perf_counter()
+
+        # run the automatic layout during a part of the frame
+        if self.layout is not None and not self.layout.update():
+            self.stop_layout()
+        t = profiler.lap('layout', t)
+
+        # the nodes of the automatic layout should stay loaded
+        if Chunks.file is not None and self.layout is None: Chunks.update()
+        t = profiler.lap('chunks', t)
+
         # move and zoom
-        pressed = pygame.mouse.get_pressed()[0]
-        mpos = pygame.mouse.get_pos()
+        pressed = Input.pressed[0]
+        mpos = Input.pos
 
         # get visible graph objects now, useful for collision checks
+        # the dragged nodes and their links are drawn separately
+        dragged, dragged_links = self.dragged, self.dragged_links
         visible_n = [] # node objects that are visible
         for node in Manager.nodes.values():
-            if node.visible():
+            if node.visible() and node not in dragged:
                 visible_n.append(node)
-        visible_l = [] # same for links
-        for link in Manager.links.values():
-            if link.n1 in visible_n or link.n2 in visible_n or link.n2 is None:
-                visible_l.append(link)
+        # links crossing the screen, extended by half the biggest link size
+        m = max(Link.rank_sizes)/2 / (self.zoom*Graph.unit_size)
+        x0, y0 = self.screen2coord(0, 0)
+        x1, y1 = self.screen2coord(Graph.W, Graph.H)
+        x0, y0, x1, y1 = x0-m, y0-m, x1+m, y1+m
+        visible_l = [link for link in LinkIndex.query(x0, y0, x1, y1)
+                     if link not in dragged_links and link.crosses(x0, y0, x1, y1)]
+        visible_l.sort(key=lambda link: link.id) # same drawing order every frame
+        if self.link is not None: visible_l.append(self.link) # being created, not in the index
+        t = profiler.lap('culling', t)
 
         self.hovered = None
         for node in visible_n:
             if node.collide(mpos):
                 self.hovered = node
                 break
-        for link in visible_l:
-            # don't select a link if something else has been selected,
-            # or if currently creating a link
-            if self.hovered is not None or self.link is not None: break
-            if link.collide(mpos): self.hovered = link
+        # don't select a link if something else has been selected,
+        # or if currently creating a link
+        if self.hovered is None and self.link is None:
+            # only check the links near the mouse, within the biggest link size
+            r = max(Link.rank_sizes) / (self.zoom*Graph.unit_size)
+            x, y = self.screen2coord(*mpos)
+            self.hovered = Link.closest(LinkIndex.query(x-r, y-r, x+r, y+r) - dragged_links, mpos)
+        t = profiler.lap('hover', t)
 
         change = False # did the user do a change this frame?
         change_zoom = False # did the zoom change this frame?
 
         # events check
         for event in events:
+            if event.type == KEYDOWN and self.search is not None and not event.mod & KMOD_CTRL:
+                self.search_input(event)
+                continue
+            if self.minimap.event(event): continue
+
             # start dragging
             if event.type == MOUSEBUTTONDOWN and event.button == 1:
                 # don't drag and select objects at the same time
@@ -1252,12 +3981,14 @@ class Graph:
 
                 # keep the selection when dragging an object,
                 # unless something not in the selection was selected
-                if self.hovered not in self.selection: self.select(self.hovered)
+                if self.hovered not in self.selected: self.select(self.hovered)
 
                 if not len(self.selection):
                     self.drag_start = (self.scroll_x, self.scroll_y)
                 elif type(self.selection[0]) == Node:
                     self.drag_start = (self.selection[0].x, self.selection[0].y)
+                    self.dragged = {obj for obj in self.selection if type(obj) == Node}
+                    self.dragged_links = {link for node in self.dragged for link in node.links}
 
                 if not len(self.selection) or type(self.selection[0]) == Node:
                     self.drag_mouse_start = event.pos
@@ -1266,18 +3997,18 @@ class Graph:
                 if len(self.selection) and type(self.selection[0]) == Node and self.link is not None and self.link.n1 != self.selection[0]:
                     # check if no link exists between these two nodes
                     ok = True
-                    for link in Manager.links.values():
-                        if (link.n1 == self.link.n1 and link.n2 == self.selection[0]) or \
-                            (link.n2 == self.link.n1 and link.n1 == self.selection[0]):
+                    for link in self.link.n1.links:
+                        if link.n1 == self.selection[0] or link.n2 == self.selection[0]:
                             ok = False
                             break
 
                     if ok:
-                        self.link.n2 = self.selection[0]
-                        self.link.refresh()
+                        self.link.attach(self.selection[0])
+                        Journal.changed_link(self.link)
                         self.link = None
                         self.select(None)
                         self.drag_start = None # prevent unwanted drag
+                        self.dragged, self.dragged_links = set(), set()
                         change = True
 
             # start selection box
@@ -1288,8 +4019,15 @@ class Graph:
 
             # stop dragging
             elif event.type == MOUSEBUTTONUP and event.button == 1:
-                self.drag_start = None
-                self.drag_mouse_start = None
+                # move the dragged nodes, unless they were deleted or unloaded since
+                dragged = [node for node in self.dragged if Manager.nodes.get(node.id) is node]
+                if self.drag_start is not None and len(dragged) and event.pos != self.drag_mouse_start:
+                    m = 1/self.zoom/self.unit_size
+                    Manager.move_nodes(dragged, (event.pos[0]-self.drag_mouse_start[0])*m,
+                                       (event.pos[1]-self.drag_mouse_start[1])*m)
+                    change = True
+
+                self.stop_drag()
 
             elif event.type == MOUSEBUTTONUP and event.button == 3:
                 x0, y0 = self.selection_box
@@ -1297,11 +4035,12 @@ class Graph:
                 if x1 < x0: x0, x1 = x1, x0
                 if y1 < y0: y0, y1 = y1, y0
                 self.selection_box = None
-                self.selection = []
+                selection = []
                 for node in Manager.nodes.values():
                     x, y = self.project(node.x, node.y)
                     if x0 <= x <= x1 and y0 <= y <= y1:
-                        self.selection.append(node)
+                        selection.append(node)
+                self.set_selection(selection)
 
             # zoom
             elif event.type == MOUSEWHEEL and not pressed:
@@ -1324,12 +4063,42 @@ class Graph:
                     self.zoom = 1
                     self.ui.refresh_zoom()
                 elif event.key == K_a:
-                    self.zoom = 1
-                    self.ui.refresh_zoom()
-                    self.scroll_x = self.scroll_y = 0
+                    if event.mod & KMOD_SHIFT: self.fit()
+                    else:
+                        self.zoom = 1
+                        self.ui.refresh_zoom()
+                        self.scroll_x = self.scroll_y = 0
                 elif event.key == K_q:
                     if quit_app():
                         return
+                elif event.key == K_f and event.mod & KMOD_CTRL:
+                    # open the search bar, or close it
+                    if self.search is None:
+                        self.search = ''
+                        self.search_ids = []
+                    else: self.search = None
+                elif event.key == K_TAB and event.mod & KMOD_CTRL:
+                    # switch to the next open document, or the previous one with Shift
+                    self.switch_document(-1 if event.mod & KMOD_SHIFT else 1)
+                elif event.key == K_n and event.mod & KMOD_CTRL:
+                    self.newfile(True)
+                elif event.key == K_o and event.mod & KMOD_CTRL:
+                    path = ask_filename()
+                    if path != '': self.open(path, True)
+                elif event.key == K_w and event.mod & KMOD_CTRL:
+                    self.close_document()
+                elif event.key == K_F3:
+                    profiler.toggle()
+                elif event.key == K_F4 and profiler.enabled:
+                    profiler.dump()
+                elif event.key == K_F5 and profiler.enabled:
+                    profiler.toggle_capture()
+                elif event.key == K_F6 and profiler.enabled:
+                    Input.toggle_recording()
+
+                elif event.key == K_ESCAPE and self.layout is not None:
+                    # cancel the automatic layout
+                    self.stop_layout(False)
 
                 elif event.key == K_ESCAPE:
                     if self.link is None:
@@ -1337,7 +4106,7 @@ class Graph:
                         self.select(None)
                     else:
                         # or undo the creation of a new link
-                        del Manager.links[self.link.id]
+                        Manager.delete_link(self.link.id)
                         self.link = None
 
                 elif event.key == K_RETURN and self.link is None:
@@ -1351,7 +4120,7 @@ class Graph:
                         if self.save_file is None: self.saveas()
                         else: self.save()
                     elif event.key == K_w:
-                        self.saveas()
+                        self.saveas(bool(event.mod & KMOD_SHIFT))
                     elif event.key == K_n:
                         if not self.changes or want_to_save() is not None:
                             self.newfile()
@@ -1359,58 +4128,72 @@ class Graph:
                         if not self.changes or want_to_save() is not None:
                             path = ask_filename()
                             if path != '': self.open(path)
+                    elif event.key == K_b:
+                        file = browse_files()
+                        if file is not None: self.open(file, True)
                     elif event.key == K_i:
-                        import_image()
+                        import_image(bool(event.mod & KMOD_SHIFT))
                     elif event.key == K_e:
                         self.export(True)
                     elif event.key == K_f:
                         self.export(False)
+                    elif event.key == K_v:
+                        self.export(False, True)
+                    elif event.key == K_d:
+                        self.export_tiles()
+                    elif event.key == K_x:
+                        self.export_format()
+                    elif event.key == K_g:
+                        if self.layout is None: self.start_layout(bool(event.mod & KMOD_SHIFT))
+                        else: self.stop_layout()
+                    elif event.key == K_u:
+                        self.show_progression = not self.show_progression
+                    elif event.key == K_m:
+                        self.minimap.enabled = not self.minimap.enabled
 
                 elif type(self.selection[0]) == Node:
+                    # the actions apply to all the selected nodes, the first one giving the default values
                     node = self.selection[0]
+                    nodes = [obj for obj in self.selection if type(obj) == Node]
                     if event.key == K_l and self.link is None:
                         self.link = Manager.new_link(node.id, None)
                         self.select(None)
                     elif event.key == K_i:
                         image = image_selector()
                         if image is not None:
-                            node.set_image(image)
+                            Manager.set_images(nodes, image)
+                            self.set_selection(self.selection) # update self.ui
                             change = True
                     elif event.key == K_t:
                         check = lambda s: '\n' not in s and '\r' not in s and '\t' not in s
                         text = ask_input_box('Enter node text:', str, check, self.W-20, node.text)
                         if text is not None:
-                            node.set_text(text)
+                            Manager.set_texts(nodes, text)
+                            self.set_selection(self.selection)
                             change = True
                     elif event.key == K_r:
-                        node.cycle_rank()
+                        Manager.set_ranks(nodes)
                         change = True
                     elif event.key == K_s:
-                        node.cycle_state()
+                        Manager.set_states(nodes)
                         change = True
                     elif event.key == K_DELETE:
                         if node.image is not None:
-                            node.set_image(None)
+                            Manager.set_images(nodes, None)
+                            self.set_selection(self.selection)
                         elif node.text:
-                            node.set_text('')
+                            Manager.set_texts(nodes, '')
+                            self.set_selection(self.selection)
                         else:
-                            to_delete = [] # links that connect to the deleted nodes
-                            for node in self.selection:
-                                for id, link in Manager.links.items():
-                                    if link.n1 == node or link.n2 == node:
-                                        to_delete.append(id)
-                                del Manager.nodes[node.id]
-                            for link in to_delete:
-                                if link in Manager.links:
-                                    del Manager.links[link]
-                            # this value will be overwritten, self.selection should never be None
-                            self.selection = [None]
-                        self.select(self.selection[0]) # update self.ui
+                            # also deletes the links that connect to the deleted nodes
+                            Manager.delete_nodes(nodes)
+                            self.select(None)
+                            self.stop_drag()
                         change = True
 
                 elif type(self.selection[0]) == Link:
                     if event.key == K_DELETE:
-                        del Manager.links[self.selection[0].id]
+                        Manager.delete_link(self.selection[0].id)
                         self.select(None)
                         change = True
 
@@ -1421,11 +4204,9 @@ class Graph:
             m = 1/self.zoom/self.unit_size
             dx = (x0-x1) * m
             dy = (y0-y1) * m
-            if len(self.selection):
-                for obj in reversed(self.selection):
-                    obj.x = x + obj.x - self.selection[0].x - dx
-                    obj.y = y + obj.y - self.selection[0].y - dy
-            else:
+            if len(self.dragged):
+                self.drag_offset = (-dx, -dy)
+            elif not len(self.selection):
                 self.scroll_x = x + dx
                 self.scroll_y = y + dy
                 change = bool(dx or dy)
@@ -1435,10 +4216,24 @@ class Graph:
             set_title(self.save_file, True)
 
         screen.fill(Palette.background)
+        t = profiler.lap('events', t)
+
+        # update and render graph objects, the dragged ones on top
+        ox, oy = self.drag_offset
+        drag_project = lambda x, y: self.project(x+ox, y+oy)
 
-        # update and render graph objects
         for link in visible_l: link.update(events, screen, self.project)
+        for link in dragged_links:
+            link.update(events, screen, drag_project if link.n1 in dragged else self.project,
+                        drag_project if link.n2 in dragged else self.project)
+        t = profiler.lap('links', t)
         for node in visible_n: node.update(events, screen, self.project)
+        for node in dragged:
+            if node.visible(drag_project): node.update(events, screen, drag_project)
+        if self.show_progression: self.draw_progression(visible_n)
+        t = profiler.lap('nodes', t)
+        profiler.count('visible nodes', len(visible_n))
+        profiler.count('visible links', len(visible_l))
 
         # update and render menu and UI
         self.ui.update(change_zoom)
@@ -1455,12 +4250,19 @@ class Graph:
             pygame.draw.rect(surf, Palette.selection_fill, Rect(1, 1, dx-2, dy-2))
 
             screen.blit(surf, (x0, y0))
+        profiler.lap('ui', t)
+
+        if self.minimap.enabled: self.minimap.update()
+        if self.search is not None: self.draw_search()
+        if len(Manager.documents) > 1: self.draw_documents()
 
         # display debug screen if needed
         if self.debug_surf is not None:
             screen.blit(self.debug_surf, (0, 0))
             self.debug_surf = None
 
+        if profiler.enabled: profiler.draw(screen)
+
 def set_title(name, unsaved=False):
     """Sets the title of the pygame application"""
 
@@ -1482,47 +4284,86 @@ def quit_app():
     Returns True if the window should be closed, otherwise False."""
     global run
 
-    res = 1 if not graph.changes else want_to_save()
+    # ask for each open document with unsaved changes
+    for document in list(Manager.documents):
+        if document is not Manager.document:
+            if not document.changes: continue
+            Manager.document.store()
+            graph.use_document(document)
+
+        res = 1 if not graph.changes else want_to_save()
 
-    if res is None: return
-    if res == 0: graph.save()
+        if res is None: return
+        if res == 0:
+            if graph.save_file is None: graph.saveas()
+            else: graph.save()
+            if graph.changes: return # the file dialog was cancelled
     run = False
     return True
 
 _FPS = 60 # actually used FPS will be based on this value
-pygame.init()
-pygame.key.set_repeat(400, 30)
-
-screen = pygame.display.set_mode((Graph.W, Graph.H), RESIZABLE)
-hwnd = pygame.display.get_wm_info()['window']
-set_title(None)
-font = pygame.font.SysFont('consolas', 16)
-font2 = pygame.font.SysFont('consolas', 12)
-clock = pygame.time.Clock()
-ticks = pygame.time.get_ticks
-
-# get the characters length (fonts should be monospace)
-char_w = font.render('_', True, Palette.text).get_width()
-char_w2 = font2.render('_', True, Palette.text).get_width()
-
-graph = Graph()
-
-dt = 0 # time passed in last frame, in seconds
-run = True
-while run:
-    active = hwnd == win32gui.GetForegroundWindow() and pygame.mouse.get_focused()
-    FPS = _FPS if active else _FPS/10
-
-    # pygame event loop
-    events = pygame.event.get()
-    for event in events:
-        if event.type == QUIT:
-            quit_app()
-        elif event.type == VIDEORESIZE:
-            graph.resize()
-
-    graph.update(events)
-    pygame.display.flip()
-    dt = clock.tick(FPS)/1000
-
-pygame.quit()
+FPS = _FPS
+
+def init():
+    """Initializes pygame, the window, the fonts and the graph.
+    Kept apart from main() so that the graph can be driven without the event loop, e.g. by the benchmarks."""
+    global screen, hwnd, font, font2, clock, ticks, char_w, char_w2, graph
+
+    pygame.init()
+    pygame.key.set_repeat(400, 30)
+
+    screen = pygame.display.set_mode((Graph.W, Graph.H), RESIZABLE)
+    hwnd = pygame.display.get_wm_info().get('window') # not available with the dummy video driver
+    set_title(None)
+    font = pygame.font.SysFont('consolas', 16)
+    font2 = pygame.font.SysFont('consolas', 12)
+    clock = pygame.time.Clock()
+    ticks = pygame.time.get_ticks
+
+    # get the characters length (fonts should be monospace)
+    char_w = font.render('_', True, Palette.text).get_width()
+    char_w2 = font2.render('_', True, Palette.text).get_width()
+
+    graph = Graph()
+
+def main():
+    """Main event loop, runs until the application is closed"""
+    global FPS, dt, run
+
+    # lower fps if window inactive, but needs win32 utils to do that
+    get_foreground = lambda: hwnd
+    if platform == 'win32':
+        try:
+            from win32gui import GetForegroundWindow as get_foreground
+        except ImportError: pass
+
+    dt = 0 # time passed in last frame, in seconds
+    run = True
+    while run:
+        active = hwnd == get_foreground() and Input.focused
+        FPS = _FPS if active else _FPS/10
+
+        # pygame event loop
+        events = Input.poll()
+        for event in events:
+            if event.type == QUIT:
+                quit_app()
+            elif event.type == VIDEORESIZE:
+                graph.resize()
+
+        graph.update(events)
+        t = perf_counter()
+        pygame.display.flip()
+        graph.profiler.lap('flip', t)
+        dt = clock.tick(FPS)/1000
+        graph.profiler.end_frame()
+
+    if Input.record_file is not None: Input.stop_recording()
+    pygame.quit()
+
+if __name__ == '__main__':
+    init()
+    # files given on the command line are opened right away, in tabs: python -m progression_graph a.graph b.graph
+    for i, file in enumerate(argv[1:]):
+        graph.open(file, i > 0)
+    main()